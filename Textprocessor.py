@@ -104,6 +104,11 @@ def split_long_text(text, max_length=70):
     
     return result
 
+def wrap_line(text, length=22):
+    """textをlength文字ごとに区切った行のリストを返す"""
+    step = max(length, 1)
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
 def add_line_breaks(text, length=22, max_total_chars=4800, do_split=True, character_set=None):
     """改行の追加とキャラクター名の挿入、文字数制限付き"""
     try:
@@ -122,7 +127,6 @@ def add_line_breaks(text, length=22, max_total_chars=4800, do_split=True, charac
         characters = character_sets[character_set]
         char_index = 0
         total_chars = 0
-        current_comment_chars = 0
         
         for comment in text.split('\n'):
             if not comment.strip():
@@ -139,19 +143,7 @@ def add_line_breaks(text, length=22, max_total_chars=4800, do_split=True, charac
                 split_comments = [comment.strip()]
             
             for split_comment in split_comments:
-                comment_lines = []
-                current_line = ''
-                current_comment_chars = 0
-                
-                for char in split_comment:
-                    current_line += char
-                    current_comment_chars += 1
-                    if len(current_line) >= length:
-                        comment_lines.append(current_line)
-                        current_line = ''
-                
-                if current_line:
-                    comment_lines.append(current_line)
+                comment_lines = wrap_line(split_comment, length)
                 
                 if comment_lines:
                     # このコメントを追加した場合の合計文字数を計算
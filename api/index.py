@@ -2,11 +2,28 @@ import os
 import re
 import logging
 import sys
-import requests
+import time
+import json
+import hashlib
+import sqlite3
+import threading
+import uuid
+import random
+from collections import deque
+from email.utils import parsedate_to_datetime
+import asyncio
+from bisect import bisect_right
+from heapq import heapify, heappush, heappop
+import httpx
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import importlib.util
+from urllib.parse import urljoin, urlsplit, parse_qs
 from bs4 import BeautifulSoup, NavigableString
 from datetime import datetime
 from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 # Step 1&3: Railway完全互換ログ設定
@@ -90,18 +107,33 @@ async def startup_event():
         logger.info("Available endpoints:")
         logger.info("  GET  / - Web UI")
         logger.info("  POST /api/scrape - スクレイピング")
+        logger.info("  POST /api/scrape/batch - 複数URLの一括スクレイピング")
         logger.info("  POST /api/process - テキスト処理")
+        logger.info("  POST /api/jobs - スクレイピングジョブの登録（GET /api/jobs/{id} で結果取得）")
         logger.info("  GET  /api/health - ヘルスチェック")
         logger.info("  GET  /api/debug/logs - ログレベルテスト")
         port = os.environ.get("PORT", "8000")
         env_type = "Railway Production" if port != "8000" else "Development"
         logger.info(f"Environment: {env_type} (Port: {port})")
+        logger.info(f"HTTP pool: size={HTTP_POOL_SIZE}, per_host={HTTP_MAX_PER_HOST}, http2={HTTP2_AVAILABLE}")
+        logger.info(f"HTML parser backend: {get_parser_backend()}")
+        ginza_segmenter.start()
+        if JOBS_ENABLED:
+            scrape_jobs.start()
+        else:
+            logger.info("Background jobs: disabled (serverless environment)")
         logger.info("Logging: All levels -> stdout (Railway error classification fixed)")
         logger.info("================================================")
     except Exception as e:
         logger.error(f"Startup error: {e}", exc_info=True)
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await scrape_jobs.shutdown()
+    await close_http_client()
+    ginza_segmenter.shutdown()
+
 # あにまんちスクレイピング機能
 def detect_animanch_urls(text):
     pattern = r'https?://bbs\.animanch\.com/board/\d+/?'
@@ -129,38 +161,52 @@ def simple_split(text, max_length=80):
     
     return result
 
+# 区切り候補と優先度（improved_rule_based_splitは先頭から見て最初に条件を満たしたものを採るため、スコアの高い順に並べること）
+RULE_BREAK_CHARS = [
+    ('。', 100), ('！', 100), ('？', 100),
+    ('、', 80), ('，', 80),
+    ('ので', 70), ('から', 70), ('けれど', 70),
+    ('という', 60), ('ところ', 60),
+    ('について', 50), ('に対して', 50),
+    ('は', 40), ('が', 40), ('を', 40), ('に', 40),
+    ('と', 30), ('で', 30), ('の', 30)
+]
+
+def find_break_positions(text, break_chars=RULE_BREAK_CHARS):
+    """区切り候補ごとの出現位置（昇順）をまとめて求める"""
+    positions = []
+    for bc, _ in break_chars:
+        found = []
+        pos = text.find(bc)
+        while pos != -1:
+            found.append(pos)
+            pos = text.find(bc, pos + 1)
+        positions.append(found)
+    return positions
+
 def improved_rule_based_split(text, max_length=80):
-    break_chars = [
-        ('。', 100), ('！', 100), ('？', 100),
-        ('、', 80), ('，', 80),
-        ('ので', 70), ('から', 70), ('けれど', 70),
-        ('という', 60), ('ところ', 60),
-        ('について', 50), ('に対して', 50),
-        ('は', 40), ('が', 40), ('を', 40), ('に', 40),
-        ('と', 30), ('で', 30), ('の', 30)
-    ]
+    """max_length文字の窓ごとに、窓の後半にある最も優先度の高い区切りで切る
+
+    区切り候補の位置を先に求めて二分探索で引くので、
+    1文字ずつ足してrfindし直していた旧実装と同じ結果を線形時間で返す
+    """
+    window = max(max_length, 1)
+    positions = find_break_positions(text)
     result = []
-    current_text = ""
-    i = 0
-    while i < len(text):
-        current_text += text[i]
-        if len(current_text) >= max_length:
-            best_pos = -1
-            best_score = 0
-            for bc, score in break_chars:
-                pos = current_text.rfind(bc)
-                if pos > len(current_text)//2 and score > best_score:
-                    best_pos = pos + len(bc)
-                    best_score = score
-            if best_pos > 0:
-                result.append(current_text[:best_pos])
-                current_text = current_text[best_pos:]
-            else:
-                result.append(current_text)
-                current_text = ""
-        i += 1
-    if current_text:
-        result.append(current_text)
+    start = 0
+    while len(text) - start >= window:
+        end = start + window
+        cut = end
+        for (bc, _), found in zip(RULE_BREAK_CHARS, positions):
+            # 窓に収まる最後の出現位置（旧実装のrfindに相当）
+            idx = bisect_right(found, end - len(bc)) - 1
+            if idx >= 0 and found[idx] - start > window // 2:
+                cut = found[idx] + len(bc)
+                break
+        result.append(text[start:cut])
+        start = cut
+    if start < len(text):
+        result.append(text[start:])
     return result
 
 def absorb_short_lines(blocks, min_length=30):
@@ -189,6 +235,142 @@ def absorb_short_lines(blocks, min_length=30):
             merged.append(block)
     return merged
 
+# GiNZA分割結果のキャッシュ（本文のハッシュで引く。SEGMENT_CACHE_DBを指定するとSQLiteにも保存）
+# ルールベース分割は線形時間でキャッシュを引くより速いのでキャッシュしない
+SEGMENT_CACHE_SIZE = int(os.environ.get("SEGMENT_CACHE_SIZE", "10000"))
+SEGMENT_CACHE_DB = os.environ.get("SEGMENT_CACHE_DB", "")
+SEGMENT_CACHE_DB_SIZE = int(os.environ.get("SEGMENT_CACHE_DB_SIZE", "200000"))
+# 分割ロジックを変えたら上げる（古いキャッシュを使わないため）
+GINZA_SPLITTER_VERSION = "ginza-1"
+
+class SegmentCache:
+    """(本文ハッシュ, max_length, min_length, 分割器バージョン) → 分割ブロック のキャッシュ
+
+    メモリ上は件数上限付きLRU、SQLite側は最終利用時刻の古いものから削除する
+    """
+    
+    def __init__(self, max_entries=SEGMENT_CACHE_SIZE, db_path=SEGMENT_CACHE_DB, db_max_entries=SEGMENT_CACHE_DB_SIZE):
+        self.max_entries = max_entries
+        self.db_max_entries = db_max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS segments "
+                    "(key TEXT PRIMARY KEY, blocks TEXT NOT NULL, used_at REAL NOT NULL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS segments_used_at ON segments (used_at)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                logging.warning(f"分割キャッシュDBを開けないためメモリのみで動作します: {e}")
+                self._db = None
+    
+    @staticmethod
+    def make_key(text, max_length, min_length, version):
+        digest = hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+        return f"{version}:{max_length}:{min_length}:{digest}"
+    
+    def get_many(self, texts, max_length, min_length, version):
+        """texts のうちキャッシュにあるものを {本文: ブロック} で返す（SQLiteは1回の問い合わせで引く）"""
+        found = {}
+        missing = {}
+        with self._lock:
+            for text in texts:
+                key = self.make_key(text, max_length, min_length, version)
+                blocks = self._entries.get(key)
+                if blocks is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    found[text] = list(blocks)
+                else:
+                    missing[key] = text
+            if missing and self._db is not None:
+                try:
+                    keys = list(missing)
+                    rows = []
+                    # SQLiteのプレースホルダ数の上限に当たらないよう分けて引く
+                    for start in range(0, len(keys), 500):
+                        chunk = keys[start:start + 500]
+                        rows.extend(self._db.execute(
+                            f"SELECT key, blocks FROM segments WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                        ).fetchall())
+                    if rows:
+                        now = time.time()
+                        self._db.executemany("UPDATE segments SET used_at = ? WHERE key = ?", [(now, key) for key, _ in rows])
+                        self._db.commit()
+                    for key, data in rows:
+                        blocks = tuple(json.loads(data))
+                        self._remember(key, blocks)
+                        self.disk_hits += 1
+                        found[missing.pop(key)] = list(blocks)
+                except sqlite3.Error as e:
+                    logging.warning(f"分割キャッシュDBの読み込みエラー: {e}")
+            self.misses += len(missing)
+        return found
+    
+    def put_many(self, items, max_length, min_length, version):
+        """(本文, ブロック) の組をまとめて保存する（SQLiteへの書き込みは1トランザクション）"""
+        rows = []
+        with self._lock:
+            now = time.time()
+            for text, blocks in items:
+                key = self.make_key(text, max_length, min_length, version)
+                blocks = tuple(blocks)
+                self._remember(key, blocks)
+                rows.append((key, json.dumps(blocks, ensure_ascii=False), now))
+            if self._db is None or not rows:
+                return
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO segments (key, blocks, used_at) VALUES (?, ?, ?)", rows)
+                self._db.commit()
+                previous = self._db_writes
+                self._db_writes += len(rows)
+                if self._db_writes // 1000 != previous // 1000:
+                    self._trim_db()
+            except sqlite3.Error as e:
+                logging.warning(f"分割キャッシュDBの書き込みエラー: {e}")
+    
+    def _remember(self, key, blocks):
+        self._entries[key] = blocks
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def _trim_db(self):
+        count = self._db.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+        if count > self.db_max_entries:
+            self._db.execute(
+                "DELETE FROM segments WHERE key IN "
+                "(SELECT key FROM segments ORDER BY used_at LIMIT ?)",
+                (count - self.db_max_entries,)
+            )
+            self._db.commit()
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'disk': self._db is not None,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+segment_cache = SegmentCache()
+
 def split_long_text(text, max_length=80, min_length=30):
     try:
         blocks = improved_rule_based_split(text, max_length)
@@ -197,6 +379,192 @@ def split_long_text(text, max_length=80, min_length=30):
         logging.error(f"テキスト分割エラー: {e}")
         return simple_split(text, max_length)
 
+# GiNZA分割ワーカー（GINZA_WORKERS>0で有効。モデルを読み込んだプロセスを常駐させる）
+GINZA_WORKERS = int(os.environ.get("GINZA_WORKERS", "0"))
+GINZA_QUEUE_SIZE = int(os.environ.get("GINZA_QUEUE_SIZE", "16"))
+GINZA_TIMEOUT = float(os.environ.get("GINZA_TIMEOUT", "10"))
+
+_worker_nlp = None
+
+def _init_ginza_worker():
+    """ワーカープロセス起動時にモデルを1回だけ読み込む"""
+    global _worker_nlp
+    import spacy
+    _worker_nlp = spacy.load("ja_ginza")
+    _worker_nlp("ウォームアップ用の文です。")
+
+def _ginza_ready():
+    return os.getpid()
+
+def _ginza_split_batch(texts, max_length=80, min_length=30):
+    """ワーカープロセス内で意味スコア分割を行う"""
+    results = []
+    for text, doc in zip(texts, _worker_nlp.pipe(texts)):
+        blocks = semantic_aware_split(text, doc, max_length, min_length)
+        results.append(absorb_short_lines(blocks, min_length))
+    return results
+
+def semantic_aware_split(text, doc, max_length=80, min_length=30):
+    scores = calculate_break_scores(doc)
+    result = []
+    start_pos = 0
+    while start_pos < len(text):
+        ideal_end = min(start_pos + max_length, len(text))
+        best_break = find_best_break_position(scores, start_pos, ideal_end, min_length)
+        if best_break > start_pos:
+            result.append(text[start_pos:best_break].strip())
+            start_pos = best_break
+        else:
+            result.append(text[start_pos:ideal_end].strip())
+            start_pos = ideal_end
+    return result
+
+def calculate_break_scores(doc):
+    scores = [0] * len(doc.text)
+    for token in doc:
+        pos = token.idx + len(token.text) - 1
+        if token.text in ['。', '！', '？']:
+            scores[pos] = 100
+        elif token.text in ['、', '，']:
+            scores[pos] = 80
+        elif token.pos_ == 'ADP':
+            scores[pos] = 60
+        elif token.dep_ in ['case', 'aux']:
+            scores[pos] = 40
+        elif token.dep_ == 'acl':
+            scores[pos] = 35
+        elif token.dep_ == 'cc':
+            scores[pos] = 10
+    return scores
+
+def find_best_break_position(scores, start, end, min_length=30):
+    for i in range(end-1, start+min_length-1, -1):
+        if scores[i] >= 60:
+            return i+1
+    for i in range(end-1, start+min_length-1, -1):
+        if scores[i] > 0:
+            return i+1
+    return start
+
+class GinzaSegmenter:
+    """GiNZAを読み込んだワーカープロセス群に分割を依頼する
+
+    キューが満杯・タイムアウト・ワーカー異常のときはNoneを返し、呼び出し側はルールベース分割に戻す
+    """
+    
+    def __init__(self, workers=GINZA_WORKERS, queue_size=GINZA_QUEUE_SIZE, timeout=GINZA_TIMEOUT):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._executor = None
+        self._slots = None
+        self.completed = 0
+        self.fallbacks = 0
+    
+    @property
+    def enabled(self):
+        return self._executor is not None
+    
+    def start(self):
+        if self.workers <= 0 or self._executor is not None:
+            return
+        if importlib.util.find_spec("spacy") is None:
+            logging.warning("spaCyが見つからないためGiNZA分割ワーカーを起動しません")
+            return
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_ginza_worker)
+        self._slots = asyncio.Semaphore(self.queue_size)
+        # 全ワーカーを起動してモデルの読み込みを先に済ませる
+        for _ in range(self.workers):
+            self._executor.submit(_ginza_ready)
+        logging.info(f"GiNZA分割ワーカーを起動: workers={self.workers}, queue={self.queue_size}")
+    
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+    
+    def _disable(self, error):
+        """プールが壊れたら（モデルの読み込み失敗やワーカーの異常終了）以降はルールベース分割だけを使う"""
+        logging.error(f"GiNZA分割ワーカーが停止したため無効にします: {error}")
+        self.shutdown()
+    
+    async def split_many(self, texts, max_length=80, min_length=30):
+        if not self.enabled or not texts:
+            return None
+        # 分割済みのテキストはワーカーに送らない（SQLiteの読み書きはイベントループの外で行う）
+        cached = await asyncio.to_thread(segment_cache.get_many, texts, max_length, min_length, GINZA_SPLITTER_VERSION)
+        if len(cached) == len(texts):
+            return [cached[text] for text in texts]
+        pending = [text for text in texts if text not in cached]
+        computed = await self._split_in_workers(pending, max_length, min_length)
+        if computed is None:
+            return None
+        items = list(zip(pending, computed))
+        await asyncio.to_thread(segment_cache.put_many, items, max_length, min_length, GINZA_SPLITTER_VERSION)
+        cached.update(items)
+        return [cached[text] for text in texts]
+    
+    async def _split_in_workers(self, texts, max_length, min_length):
+        if self._slots.locked():
+            self.fallbacks += 1
+            logging.warning("GiNZA分割キューが満杯のためルールベース分割を使用します")
+            return None
+        await self._slots.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._executor, _ginza_split_batch, texts, max_length, min_length)
+        except BrokenProcessPool as e:
+            self._slots.release()
+            self.fallbacks += 1
+            self._disable(e)
+            return None
+        except Exception as e:
+            self._slots.release()
+            self.fallbacks += 1
+            logging.error(f"GiNZA分割の依頼に失敗: {e}")
+            return None
+        # タイムアウトしてもワーカー側の処理が終わるまで枠を返さない
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.fallbacks += 1
+            logging.warning(f"GiNZA分割が{self.timeout}秒以内に終わらないためルールベース分割を使用します")
+            return None
+        except BrokenProcessPool as e:
+            self.fallbacks += 1
+            self._disable(e)
+            return None
+        except Exception as e:
+            self.fallbacks += 1
+            logging.error(f"GiNZA分割エラー: {e}")
+            return None
+        self.completed += 1
+        return result
+    
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'completed': self.completed,
+            'fallbacks': self.fallbacks
+        }
+
+ginza_segmenter = GinzaSegmenter()
+
+def collect_split_targets(text, max_total_chars=4800):
+    """add_line_breaksで分割対象になるコメント本文を、文字数上限に届くまで集める"""
+    targets = []
+    total_chars = 0
+    for comment in iter_text_lines(text):
+        if total_chars > max_total_chars:
+            break
+        total_chars += len(comment)
+        if len(comment) > 80 and comment not in targets:
+            targets.append(comment)
+    return targets
+
 def clean_text(text):
     try:
         text = re.sub(r'>>\d+\s*', '', text)
@@ -224,217 +592,1360 @@ def clean_text(text):
         logging.error(f"テキストクリーニングエラー: {e}")
         return text
 
-def add_line_breaks(text, length=22, max_total_chars=4800, do_split=True):
-    try:
-        result_lines = []
-        characters = ['ゆっくり霊夢', 'ゆっくり魔理沙', 'ゆっくり妖夢']
-        char_index = 0
-        total_chars = 0
+def wrap_line(text, length=22):
+    """textをlength文字ごとに区切った行のリストを返す"""
+    step = max(length, 1)
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
+def iter_text_lines(text):
+    """貼り付けテキストを1行1コメントとして、空行を除いた本文を順に返す"""
+    start = 0
+    while start <= len(text):
+        end = text.find('\n', start)
+        if end == -1:
+            end = len(text)
+        line = text[start:end].strip()
+        start = end + 1
+        if line:
+            yield line.strip('"')
+
+def iter_speaker_lines(texts, length=22, max_total_chars=4800, do_split=True, presplit=None):
+    """本文を1件ずつ受け取り、話者付きの行を順に返す
+
+    max_total_charsに達した時点で終了するので、上流のジェネレータもそれ以上読まれない
+    """
+    characters = ['ゆっくり霊夢', 'ゆっくり魔理沙', 'ゆっくり妖夢']
+    char_index = 0
+    total_chars = 0
+    
+    for comment in texts:
+        current_char = characters[char_index]
+        char_index = (char_index + 1) % len(characters)
         
-        for comment in text.split('\n'):
-            if not comment.strip():
-                continue
-            comment = comment.strip().strip('"')
-            current_char = characters[char_index]
-            char_index = (char_index + 1) % len(characters)
-            
-            if do_split and len(comment) > 80:
-                split_comments = split_long_text(comment)
-            else:
-                split_comments = [comment]
+        if do_split and len(comment) > 80:
+            # GiNZAワーカーで分割済みならその結果を使う
+            split_comments = (presplit or {}).get(comment) or split_long_text(comment)
+        else:
+            split_comments = [comment]
+        
+        for split_comment in split_comments:
+            comment_lines = wrap_line(split_comment, length)
             
-            for split_comment in split_comments:
-                comment_lines = []
-                current_line = ''
-                for char in split_comment:
-                    current_line += char
-                    if len(current_line) >= length:
-                        comment_lines.append(current_line)
-                        current_line = ''
-                if current_line:
-                    comment_lines.append(current_line)
+            if comment_lines:
+                comment_text = '\n'.join(comment_lines)
+                comment_length = len(split_comment)
                 
-                if comment_lines:
-                    comment_text = '\n'.join(comment_lines)
-                    comment_length = len(split_comment)
-                    
-                    if total_chars + comment_length > max_total_chars and total_chars > 0:
-                        return '\n'.join(result_lines)
-                    
-                    formatted_comment = f'{current_char}\t"{comment_text}"\t{comment_length}'
-                    result_lines.append(formatted_comment)
-                    total_chars += comment_length
-        
-        return '\n'.join(result_lines)
+                if total_chars + comment_length > max_total_chars and total_chars > 0:
+                    return
+                
+                yield f'{current_char}\t"{comment_text}"\t{comment_length}'
+                total_chars += comment_length
+
+def add_line_breaks(text, length=22, max_total_chars=4800, do_split=True, presplit=None):
+    try:
+        return '\n'.join(iter_speaker_lines(
+            iter_text_lines(text),
+            length=length,
+            max_total_chars=max_total_chars,
+            do_split=do_split,
+            presplit=presplit
+        ))
     except Exception as e:
         logging.error(f"改行追加エラー: {e}")
         raise
 
-async def scrape_animanch(url):
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
+# 共有HTTPクライアント（接続をリクエスト間で再利用し、イベントループをブロックしない）
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
+}
+FETCH_TIMEOUT = 15
+
+# 接続プール設定（環境変数で調整可能）
+HTTP_POOL_SIZE = int(os.environ.get("ANIMANCH_POOL_SIZE", "20"))
+HTTP_MAX_PER_HOST = int(os.environ.get("ANIMANCH_MAX_PER_HOST", "6"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("ANIMANCH_KEEPALIVE_EXPIRY", "30"))
+
+# h2がインストールされていればHTTP/2を使う
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# ホストごとの取得スケジューラ設定（トークンバケットのレート、AIMDで増減する同時接続数、再試行）
+HOST_RATE = float(os.environ.get("ANIMANCH_RATE", "5"))
+HOST_BURST = float(os.environ.get("ANIMANCH_BURST", "5"))
+HOST_TARGET_LATENCY = float(os.environ.get("ANIMANCH_TARGET_LATENCY", "3"))
+FETCH_RETRIES = int(os.environ.get("ANIMANCH_RETRIES", "3"))
+FETCH_BACKOFF_BASE = float(os.environ.get("ANIMANCH_BACKOFF_BASE", "0.5"))
+FETCH_BACKOFF_MAX = float(os.environ.get("ANIMANCH_BACKOFF_MAX", "30"))
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+_http_client = None
+_host_schedulers = {}
+
+def get_http_client():
+    """プロセス共有の非同期HTTPクライアントを返す（初回呼び出し時に生成）"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            timeout=FETCH_TIMEOUT,
+            follow_redirects=True,
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_SIZE,
+                max_keepalive_connections=HTTP_POOL_SIZE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            )
+        )
+    return _http_client
+
+class HostScheduler:
+    """1ホスト分の取得スケジューラ
+
+    - トークンバケットで1秒あたりのリクエスト数を制限する
+    - 同時接続数の上限をAIMDで調整する（成功で少しずつ増やし、429/5xx/通信エラーで半分、遅い応答で2割減らす）
+    - Retry-Afterを受けたら指定時間そのホストへのリクエストを止める
+    """
+    
+    def __init__(self, rate=HOST_RATE, burst=HOST_BURST, max_concurrency=HTTP_MAX_PER_HOST,
+                 target_latency=HOST_TARGET_LATENCY):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.target_latency = target_latency
+        self.limit = float(self.max_concurrency)
+        self.tokens = self.burst
+        self.active = 0
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._waiters = deque()
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.retries = 0
+    
+    def _refill(self, now):
+        if self.rate <= 0:
+            self.tokens = self.burst
+            return
+        if now > self._updated:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+    
+    def _wait_time(self, now):
+        """今すぐ開始できるなら0、待つ必要があれば秒数（空きが出るまでならNone）"""
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        if self.active >= int(self.limit):
+            return None
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+    
+    async def acquire(self, max_wait=None):
+        """リクエストを開始してよくなるまで待つ（Retry-Afterによる停止がmax_waitより長ければhttpx.HTTPError）"""
+        while True:
+            now = time.monotonic()
+            if max_wait is not None and self.blocked_until - now > max_wait:
+                raise httpx.HTTPError(f"Retry-Afterにより {self.blocked_until - now:.0f}秒間リクエストを停止中です")
+            wait = self._wait_time(now)
+            if wait == 0:
+                self.tokens -= 1
+                self.active += 1
+                self.requests += 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, wait)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+    
+    def release(self, status=None, latency=None, retry_after=None, failed=False):
+        """取得結果を反映して枠を返す（statusもfailedもなければ上限は変えない）"""
+        self.active -= 1
+        if failed or status in RETRYABLE_STATUS:
+            self.limit = max(1.0, self.limit / 2)
+            if status in (429, 503):
+                self.throttled += 1
+            else:
+                self.errors += 1
+        elif status is not None:
+            if latency is not None and latency > self.target_latency:
+                self.limit = max(1.0, self.limit * 0.8)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+        if retry_after is not None:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        if status in (429, 503):
+            # 制限が明けた直後にまとめて送らないよう、バケットを空にして明けた時点から補充する
+            self.tokens = min(self.tokens, 0.0)
+            self._updated = max(self._updated, self.blocked_until, time.monotonic())
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+    
+    def stats(self):
+        now = time.monotonic()
+        self._refill(now)
+        return {
+            'limit': round(self.limit, 2),
+            'active': self.active,
+            'tokens': round(self.tokens, 2),
+            'blocked_for': round(max(self.blocked_until - now, 0), 2),
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'errors': self.errors,
+            'retries': self.retries
         }
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # ページタイトルを取得
-        title_element = soup.find('title')
-        page_title = title_element.text.strip() if title_element else "タイトル不明"
-        
-        thread_title_element = soup.select_one('#threadTitle')
-        if thread_title_element:
-            thread_title_text = ""
-            for node in thread_title_element.contents:
-                if isinstance(node, (str, NavigableString)):
-                    text_content = str(node).strip()
-                    if text_content:
-                        thread_title_text += text_content
-                else:
-                    break
-            
-            if not thread_title_text:
-                thread_title_text = thread_title_element.get_text().strip()
-                thread_title_text = re.sub(r'(共有|シェア|お気に入り|ブックマーク).*$', '', thread_title_text).strip()
-                thread_title_text = re.sub(r'(favorite|share|bookmark).*$', '', thread_title_text, flags=re.IGNORECASE).strip()
-            
-            if thread_title_text:
-                page_title = thread_title_text
-        
-        comments = {}
+
+def get_host_scheduler(host):
+    """ホストごとのスケジューラを返す（初回呼び出し時に生成）"""
+    scheduler = _host_schedulers.get(host)
+    if scheduler is None:
+        scheduler = HostScheduler()
+        _host_schedulers[host] = scheduler
+    return scheduler
+
+def parse_retry_after(value):
+    """Retry-Afterヘッダー（秒数またはHTTP日付）を秒数にする（解釈できなければNone）"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(retry_at.tzinfo)).total_seconds(), 0.0)
+
+def backoff_delay(attempt):
+    """再試行までの待ち時間（指数バックオフにフルジッターをかける）"""
+    return random.uniform(0, min(FETCH_BACKOFF_MAX, FETCH_BACKOFF_BASE * (2 ** attempt)))
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+async def fetch_page(url, headers=None):
+    """ホストのスケジューラを通してページを取得する
+
+    429/5xxと通信エラーは再試行する（Retry-Afterがあればその時間、なければジッター付きで待つ）。
+    304は条件付きGETの正常応答なのでエラーにしない
+    """
+    client = get_http_client()
+    scheduler = get_host_scheduler(httpx.URL(url).host)
+    for attempt in range(FETCH_RETRIES + 1):
+        await scheduler.acquire(FETCH_BACKOFF_MAX)
+        started = time.monotonic()
+        try:
+            response = await client.get(url, headers=headers)
+        except httpx.TransportError as e:
+            scheduler.release(failed=True)
+            if attempt == FETCH_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            logging.warning(f"通信エラーのため{delay:.1f}秒後に再試行します ({attempt + 1}/{FETCH_RETRIES}): {url}: {e}")
+        except BaseException:
+            scheduler.release()
+            raise
+        else:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            scheduler.release(response.status_code, time.monotonic() - started, retry_after)
+            if response.status_code not in RETRYABLE_STATUS:
+                if response.status_code != 304:
+                    response.raise_for_status()
+                return response
+            # 待ち時間が長すぎるRetry-Afterは待たずに失敗させる（ホストは指定時間止めたまま）
+            if attempt == FETCH_RETRIES or (retry_after is not None and retry_after > FETCH_BACKOFF_MAX):
+                response.raise_for_status()
+            delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            logging.warning(f"HTTP {response.status_code} のため{delay:.1f}秒後に再試行します ({attempt + 1}/{FETCH_RETRIES}): {url}")
+        scheduler.retries += 1
+        # Retry-Afterの間はacquireが待つので、ここで重ねて待たない
+        if scheduler.blocked_until <= time.monotonic():
+            await asyncio.sleep(delay)
+
+async def scrape_animanch(url, stream=None, response_headers=None):
+    try:
+        if stream if stream is not None else STREAM_PARSE:
+            return await scrape_animanch_streaming(url, response_headers=response_headers)
+        response = await fetch_page(url)
+        # HTML解析はCPU処理なのでスレッドに逃がしてイベントループを空ける
+        return await asyncio.to_thread(parse_animanch_html, response.text, url)
+    except Exception as e:
+        logging.error(f"スクレイピングエラー: {e}")
+        raise
+
+# HTMLパーサーのバックエンド（html.parser / lxml / selectolax）
+PARSER_BACKEND = os.environ.get("ANIMANCH_PARSER", "html.parser")
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:
+    SelectolaxParser = None
+
+try:
+    import lxml  # noqa: F401
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+def get_parser_backend(name=None):
+    """利用可能なパーサーバックエンド名を返す（未インストールならhtml.parserに戻す）"""
+    name = name or PARSER_BACKEND
+    if name == 'selectolax' and SelectolaxParser is None:
+        logging.warning("selectolaxが見つからないためhtml.parserを使用します")
+        return 'html.parser'
+    if name == 'lxml' and not LXML_AVAILABLE:
+        logging.warning("lxmlが見つからないためhtml.parserを使用します")
+        return 'html.parser'
+    if name not in ('html.parser', 'lxml', 'selectolax'):
+        logging.warning(f"不明なパーサー指定のためhtml.parserを使用します: {name}")
+        return 'html.parser'
+    return name
+
+def clean_thread_title(title_text):
+    title_text = re.sub(r'(共有|シェア|お気に入り|ブックマーク).*$', '', title_text).strip()
+    return re.sub(r'(favorite|share|bookmark).*$', '', title_text, flags=re.IGNORECASE).strip()
+
+def parse_animanch_html(html, url, after_id=0, backend=None):
+    """HTMLからタイトルとコメントを抽出する（after_idより大きいレス番号のみ）"""
+    backend = get_parser_backend(backend)
+    if after_id:
+        # 差分更新時は取得済みのレスを文字列のまま読み飛ばし、新着分だけをDOMにする
+        html = strip_parsed_items(html, after_id)
+    if backend == 'selectolax':
+        tree = SelectolaxParser(html)
+        page_title = extract_page_title_selectolax(tree)
+        comment_items = tree.css('li.list-group-item')
+        parse_item = parse_comment_node
+    else:
+        soup = BeautifulSoup(html, backend)
+        page_title = extract_page_title(soup)
         comment_items = soup.select('li.list-group-item')
+        parse_item = parse_comment_item
+    
+    comments = {}
+    for item in comment_items:
+        try:
+            if backend == 'selectolax':
+                item_id = item.attributes.get('id') or ''
+            else:
+                item_id = item.get('id', '')
+            res_id_match = re.search(r'res(\d+)', item_id)
+            if not res_id_match:
+                continue
+            # 差分更新時は取得済みのレスを解析しない
+            if int(res_id_match.group(1)) <= after_id:
+                continue
+            comment = parse_item(item, res_id_match.group(1))
+            if comment:
+                comments[comment['id']] = comment
+        except Exception as e:
+            logging.error(f"コメント処理エラー: {e}")
+    
+    return {
+        'title': page_title,
+        'comments': comments,
+        'url': url
+    }
+
+def extract_page_title(soup):
+    # ページタイトルを取得
+    title_element = soup.find('title')
+    page_title = title_element.text.strip() if title_element else "タイトル不明"
+    
+    thread_title_element = soup.select_one('#threadTitle')
+    if thread_title_element:
+        thread_title_text = ""
+        for node in thread_title_element.contents:
+            if isinstance(node, (str, NavigableString)):
+                text_content = str(node).strip()
+                if text_content:
+                    thread_title_text += text_content
+            else:
+                break
         
-        for item in comment_items:
-            try:
-                res_id_match = re.search(r'res(\d+)', item.get('id', ''))
-                if not res_id_match:
-                    continue
-                comment_id = res_id_match.group(1)
-                
-                resheader = item.select_one('.resheader')
-                if not resheader:
-                    continue
-                resnumber = resheader.select_one('.resnumber')
-                if not resnumber:
-                    continue
-                
-                comment_number = resnumber.text.strip()
-                author = resheader.select_one('.resname')
-                author_text = author.text.strip() if author else "不明"
-                date = resheader.select_one('.resposted')
-                date_text = date.text.strip() if date else "日時不明"
-                
-                resbody = item.select_one('div[class^="resbody"]')
-                if not resbody:
-                    continue
-                
-                anchors = []
-                reslinks = resbody.select('a.reslink')
-                for reslink in reslinks:
-                    anchor_match = re.search(r'>>(\d+)', reslink.text)
-                    if anchor_match:
-                        anchor_id = anchor_match.group(1)
-                        if anchor_id not in anchors:
-                            anchors.append(anchor_id)
-                
-                paragraphs = []
-                for p in resbody.find_all('p'):
-                    if not p.parent or p.parent.name != 'blockquote':
-                        if not p.select('img') and not p.select('a.thumb'):
-                            paragraphs.append(p)
-                
-                comment_text = ""
-                for p in paragraphs:
-                    p_text = p.get_text()
-                    for anchor in anchors:
-                        p_text = p_text.replace(f">>{anchor}", "")
-                    p_text = p_text.strip()
-                    if p_text == "このレスは削除されています":
-                        continue
-                    if p_text:
-                        if comment_text:
-                            comment_text += " " + p_text
-                        else:
-                            comment_text = p_text
-                
-                if resbody.select('a.thumb img'):
-                    if comment_text:
-                        comment_text += " [画像あり]"
-                    else:
-                        comment_text = "[画像あり]"
-                
-                if comment_text:
-                    comments[comment_id] = {
-                        'id': comment_id,
-                        'number': comment_number,
-                        'author': author_text,
-                        'date': date_text,
-                        'text': comment_text,
-                        'anchors': anchors
-                    }
-                
-            except Exception as e:
-                logging.error(f"コメント処理エラー: {e}")
+        if not thread_title_text:
+            thread_title_text = clean_thread_title(thread_title_element.get_text().strip())
+        
+        if thread_title_text:
+            page_title = thread_title_text
+    return page_title
+
+def extract_page_title_selectolax(tree):
+    """extract_page_titleのselectolax版（同じ結果を返す）"""
+    title_element = tree.css_first('title')
+    page_title = title_element.text().strip() if title_element else "タイトル不明"
+    
+    thread_title_element = tree.css_first('#threadTitle')
+    if thread_title_element:
+        thread_title_text = ""
+        for node in thread_title_element.iter(include_text=True):
+            if node.tag == '-text':
+                text_content = node.text_content.strip()
+            elif node.tag == '-comment':
+                # BeautifulSoupではコメントもテキストノードとして扱われる
+                text_content = node.html[4:-3].strip()
+            else:
+                break
+            if text_content:
+                thread_title_text += text_content
         
+        if not thread_title_text:
+            thread_title_text = clean_thread_title(thread_title_element.text().strip())
+        
+        if thread_title_text:
+            page_title = thread_title_text
+    return page_title
+
+def parse_comment_item(item, comment_id):
+    """li.list-group-item 1件からコメント情報を抽出する（本文が空ならNone）"""
+    resheader = item.select_one('.resheader')
+    if not resheader:
+        return None
+    resnumber = resheader.select_one('.resnumber')
+    if not resnumber:
+        return None
+    
+    comment_number = resnumber.text.strip()
+    author = resheader.select_one('.resname')
+    author_text = author.text.strip() if author else "不明"
+    date = resheader.select_one('.resposted')
+    date_text = date.text.strip() if date else "日時不明"
+    
+    resbody = item.select_one('div[class^="resbody"]')
+    if not resbody:
+        return None
+    
+    anchors = []
+    reslinks = resbody.select('a.reslink')
+    for reslink in reslinks:
+        anchor_match = re.search(r'>>(\d+)', reslink.text)
+        if anchor_match:
+            anchor_id = anchor_match.group(1)
+            if anchor_id not in anchors:
+                anchors.append(anchor_id)
+    
+    paragraphs = []
+    for p in resbody.find_all('p'):
+        if not p.parent or p.parent.name != 'blockquote':
+            if not p.select('img') and not p.select('a.thumb'):
+                paragraphs.append(p)
+    
+    comment_text = ""
+    for p in paragraphs:
+        p_text = p.get_text()
+        for anchor in anchors:
+            p_text = p_text.replace(f">>{anchor}", "")
+        p_text = p_text.strip()
+        if p_text == "このレスは削除されています":
+            continue
+        if p_text:
+            if comment_text:
+                comment_text += " " + p_text
+            else:
+                comment_text = p_text
+    
+    if resbody.select('a.thumb img'):
+        if comment_text:
+            comment_text += " [画像あり]"
+        else:
+            comment_text = "[画像あり]"
+    
+    if not comment_text:
+        return None
+    return {
+        'id': comment_id,
+        'number': comment_number,
+        'author': author_text,
+        'date': date_text,
+        'text': comment_text,
+        'anchors': anchors
+    }
+
+def parse_comment_node(item, comment_id):
+    """parse_comment_itemのselectolax版（同じコメント辞書を返す）"""
+    resheader = item.css_first('.resheader')
+    if not resheader:
+        return None
+    resnumber = resheader.css_first('.resnumber')
+    if not resnumber:
+        return None
+    
+    comment_number = resnumber.text().strip()
+    author = resheader.css_first('.resname')
+    author_text = author.text().strip() if author else "不明"
+    date = resheader.css_first('.resposted')
+    date_text = date.text().strip() if date else "日時不明"
+    
+    resbody = item.css_first('div[class^="resbody"]')
+    if not resbody:
+        return None
+    
+    anchors = []
+    for reslink in resbody.css('a.reslink'):
+        anchor_match = re.search(r'>>(\d+)', reslink.text())
+        if anchor_match:
+            anchor_id = anchor_match.group(1)
+            if anchor_id not in anchors:
+                anchors.append(anchor_id)
+    
+    comment_text = ""
+    for p in resbody.css('p'):
+        if p.parent is not None and p.parent.tag == 'blockquote':
+            continue
+        if p.css_first('img') or p.css_first('a.thumb'):
+            continue
+        p_text = p.text()
+        for anchor in anchors:
+            p_text = p_text.replace(f">>{anchor}", "")
+        p_text = p_text.strip()
+        if p_text == "このレスは削除されています":
+            continue
+        if p_text:
+            if comment_text:
+                comment_text += " " + p_text
+            else:
+                comment_text = p_text
+    
+    if resbody.css_first('a.thumb img'):
+        if comment_text:
+            comment_text += " [画像あり]"
+        else:
+            comment_text = "[画像あり]"
+    
+    if not comment_text:
+        return None
+    return {
+        'id': comment_id,
+        'number': comment_number,
+        'author': author_text,
+        'date': date_text,
+        'text': comment_text,
+        'anchors': anchors
+    }
+
+# ストリーミング抽出（ページ全体のDOMを作らず、レスが閉じるたびに1件ずつ解析する）
+STREAM_PARSE = os.environ.get("ANIMANCH_STREAM_PARSE", "0") == "1"
+STREAM_CHUNK_SIZE = 16384
+_LI_TAG_PATTERN = re.compile(r'<(/?)li\b[^>]*>', re.IGNORECASE)
+_LIST_ITEM_CLASS_PATTERN = re.compile(r'class\s*=\s*["\']?[^"\'>]*\blist-group-item\b', re.IGNORECASE)
+_RES_ID_ATTR_PATTERN = re.compile(r'\bid\s*=\s*["\']?res(\d+)', re.IGNORECASE)
+
+def strip_parsed_items(html, after_id):
+    """レス番号がafter_id以下のレスのHTMLを取り除く
+
+    最初のレスより前（タイトルを含む部分）と、after_idより大きい最初のレス以降だけを残す。
+    レス番号のないlist-group-item（お知らせ等）はレスとして扱わない
+    """
+    first_item = None
+    for match in _LI_TAG_PATTERN.finditer(html):
+        tag = match.group(0)
+        if match.group(1) == '/' or not _LIST_ITEM_CLASS_PATTERN.search(tag):
+            continue
+        res_id_match = _RES_ID_ATTR_PATTERN.search(tag)
+        if not res_id_match:
+            continue
+        if first_item is None:
+            first_item = match.start()
+        if int(res_id_match.group(1)) > after_id:
+            return html[:first_item] + html[match.start():]
+    return html if first_item is None else html[:first_item]
+
+class CommentStreamExtractor:
+    """チャンク単位で受け取ったHTMLから li.list-group-item を切り出して解析する
+
+    保持するのはタイトル取得前のヘッダー部分と、閉じていない1件分のレスだけ
+    """
+    
+    def __init__(self, after_id=0, backend=None):
+        self.backend = get_parser_backend(backend)
+        self.after_id = after_id
+        self.title = None
+        self._buffer = ""
+        self._scan_pos = 0
+        self._item_start = None
+        self._depth = 0
+    
+    def feed(self, chunk):
+        """チャンクを追加し、閉じたレスのコメント辞書のリストを返す"""
+        self._buffer += chunk
+        return self._drain()
+    
+    def close(self):
+        comments = self._drain()
+        if self.title is None:
+            self.title = self._parse_title(self._buffer)
+        self._buffer = ""
+        self._scan_pos = 0
+        return comments
+    
+    def _drain(self):
+        comments = []
+        buffer = self._buffer
+        pos = self._scan_pos
+        while True:
+            match = _LI_TAG_PATTERN.search(buffer, pos)
+            if not match:
+                break
+            pos = match.end()
+            closing = match.group(1) == '/'
+            if self._item_start is None:
+                # レス番号のないlist-group-item（お知らせ等）はレスとして切り出さず、タイトルの境界にもしない
+                tag = match.group(0)
+                if closing or not _LIST_ITEM_CLASS_PATTERN.search(tag) or not _RES_ID_ATTR_PATTERN.search(tag):
+                    continue
+                if self.title is None:
+                    self.title = self._parse_title(buffer[:match.start()])
+                self._item_start = match.start()
+                self._depth = 1
+            else:
+                self._depth += -1 if closing else 1
+                if self._depth == 0:
+                    comment = self._parse_item(buffer[self._item_start:pos])
+                    if comment:
+                        comments.append(comment)
+                    self._item_start = None
+        
+        # 解析済みの部分を捨てる（途中で切れたタグは次のチャンクと合わせて読む）
+        if self._item_start is not None:
+            keep_from = self._item_start
+            self._item_start = 0
+        elif self.title is None:
+            keep_from = 0
+        else:
+            last_open = buffer.rfind('<', pos)
+            if last_open != -1 and buffer.find('>', last_open) == -1:
+                keep_from = last_open
+            else:
+                keep_from = len(buffer)
+        self._buffer = buffer[keep_from:]
+        self._scan_pos = max(pos - keep_from, 0)
+        return comments
+    
+    def _parse_title(self, html):
+        if self.backend == 'selectolax':
+            return extract_page_title_selectolax(SelectolaxParser(html))
+        return extract_page_title(BeautifulSoup(html, self.backend))
+    
+    def _parse_item(self, fragment):
+        try:
+            if self.backend == 'selectolax':
+                item = SelectolaxParser(fragment).css_first('li')
+                item_id = item.attributes.get('id') or ''
+            else:
+                item = BeautifulSoup(fragment, self.backend).find('li')
+                item_id = item.get('id', '')
+            res_id_match = re.search(r'res(\d+)', item_id)
+            if not res_id_match or int(res_id_match.group(1)) <= self.after_id:
+                return None
+            if self.backend == 'selectolax':
+                return parse_comment_node(item, res_id_match.group(1))
+            return parse_comment_item(item, res_id_match.group(1))
+        except Exception as e:
+            logging.error(f"コメント処理エラー: {e}")
+            return None
+
+async def stream_animanch_comments(url, after_id=0, backend=None, response_headers=None):
+    """ページを読み進めながら ('title', タイトル) を1回、続いて ('comment', コメント辞書) を順に返す
+
+    response_headersに辞書を渡すと、応答ヘッダー（キーは小文字）をそこに書き込む
+    """
+    extractor = CommentStreamExtractor(after_id=after_id, backend=backend)
+    title_sent = False
+    client = get_http_client()
+    scheduler = get_host_scheduler(httpx.URL(url).host)
+    # 読み始めてからは再試行できないので、スケジューラの枠だけ使う
+    await scheduler.acquire(FETCH_BACKOFF_MAX)
+    outcome = {}
+    try:
+        started = time.monotonic()
+        async with client.stream('GET', url) as response:
+            outcome = {
+                'status': response.status_code,
+                'latency': time.monotonic() - started,
+                'retry_after': parse_retry_after(response.headers.get('Retry-After'))
+            }
+            response.raise_for_status()
+            if response_headers is not None:
+                response_headers.update(response.headers.items())
+            async for chunk in response.aiter_text(STREAM_CHUNK_SIZE):
+                comments = await asyncio.to_thread(extractor.feed, chunk)
+                if not title_sent and extractor.title is not None:
+                    title_sent = True
+                    yield 'title', extractor.title
+                for comment in comments:
+                    yield 'comment', comment
+            comments = extractor.close()
+    except httpx.TransportError:
+        outcome = {'failed': True}
+        raise
+    finally:
+        scheduler.release(**outcome)
+    if not title_sent:
+        yield 'title', extractor.title
+    for comment in comments:
+        yield 'comment', comment
+
+async def scrape_animanch_streaming(url, response_headers=None):
+    """stream_animanch_commentsの結果をscrape_animanchと同じ形にまとめる"""
+    result = {
+        'title': "タイトル不明",
+        'comments': {},
+        'url': url
+    }
+    async for kind, value in stream_animanch_comments(url, response_headers=response_headers):
+        if kind == 'title':
+            result['title'] = value
+        else:
+            result['comments'][value['id']] = value
+    return result
+
+# 複数ページにまたがるスレッドの巡回取得
+CRAWL_MAX_WORKERS = int(os.environ.get("CRAWL_MAX_WORKERS", "4"))
+CRAWL_MAX_PAGES = int(os.environ.get("CRAWL_MAX_PAGES", "50"))
+_HREF_PATTERN = re.compile(r'href\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+
+def normalize_page_url(url):
+    return urlsplit(url)._replace(fragment='').geturl()
+
+def discover_thread_pages(html, url):
+    """ページ内のリンクから同じスレッドの別ページ（?page=N または /board/<id>/N/）を集める"""
+    board_id = extract_board_id(url)
+    if board_id is None:
+        return []
+    base = urlsplit(url)
+    page_path = re.compile(rf'^/board/{board_id}/(\d+/?)?$')
+    pages = []
+    for href in _HREF_PATTERN.findall(html):
+        target = urlsplit(urljoin(url, href.replace('&amp;', '&')))
+        if target.netloc != base.netloc:
+            continue
+        path_match = page_path.match(target.path)
+        if not path_match:
+            continue
+        if not path_match.group(1) and 'page' not in parse_qs(target.query):
+            continue
+        page_url = normalize_page_url(target.geturl())
+        if page_url != normalize_page_url(url) and page_url not in pages:
+            pages.append(page_url)
+    return pages
+
+def parse_thread_page(html, url):
+    return parse_animanch_html(html, url), discover_thread_pages(html, url)
+
+async def crawl_thread(url, max_workers=None, max_pages=None):
+    """スレッドの全ページを並列取得し、レス番号順の1つのcomments辞書にまとめる"""
+    max_workers = max_workers or CRAWL_MAX_WORKERS
+    max_pages = max_pages or CRAWL_MAX_PAGES
+    semaphore = asyncio.Semaphore(max_workers)
+    
+    async def fetch_and_parse(page_url):
+        async with semaphore:
+            response = await fetch_page(page_url)
+        return await asyncio.to_thread(parse_thread_page, response.text, page_url)
+    
+    first, pending = await fetch_and_parse(url)
+    seen = {normalize_page_url(url)}
+    merged = dict(first['comments'])
+    # 取得したページから新しいページが見つかる限り巡回を続ける
+    while pending:
+        batch = []
+        for page_url in pending:
+            if page_url not in seen and len(seen) < max_pages:
+                seen.add(page_url)
+                batch.append(page_url)
+        if not batch:
+            break
+        pages = await asyncio.gather(*(fetch_and_parse(page_url) for page_url in batch))
+        pending = []
+        for result, links in pages:
+            merged.update(result['comments'])
+            pending.extend(links)
+    
+    logging.info(f"巡回完了: {len(seen)} ページ, {len(merged)} 件のコメント")
+    return {
+        'title': first['title'],
+        'comments': dict(sorted(merged.items(), key=lambda item: int(item[0]))),
+        'url': url
+    }
+
+# スレッド取得結果のキャッシュ（板ID単位、TTL + メモリ上限付きLRU）
+THREAD_CACHE_TTL = float(os.environ.get("THREAD_CACHE_TTL", "300"))
+THREAD_CACHE_MAX_BYTES = int(os.environ.get("THREAD_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# 再取得時に新着レスだけを解析して既存結果にマージする
+THREAD_INCREMENTAL_REFRESH = os.environ.get("THREAD_INCREMENTAL_REFRESH", "1") != "0"
+
+def extract_board_id(url):
+    match = re.search(r'/board/(\d+)', url)
+    return match.group(1) if match else None
+
+def estimate_result_size(result):
+    """キャッシュ上限判定用のおおよそのメモリ使用量（バイト）"""
+    size = sys.getsizeof(result['title']) + sys.getsizeof(result['url'])
+    for comment in result['comments'].values():
+        size += 240 + sum(sys.getsizeof(comment[key]) for key in ('id', 'number', 'author', 'date', 'text'))
+        size += 64 * len(comment['anchors'])
+    return size
+
+class ThreadCache:
+    """scrape_animanchの結果を板IDごとに保持するLRUキャッシュ"""
+    
+    def __init__(self, ttl=THREAD_CACHE_TTL, max_bytes=THREAD_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revalidations = 0
+    
+    def get(self, board_id):
+        entry = self._entries.get(board_id)
+        if entry is None or time.monotonic() - entry['stored_at'] > self.ttl:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(board_id)
+        self.hits += 1
+        return entry['result']
+    
+    def get_stale(self, board_id):
+        """期限切れでも再検証用にエントリを返す（ヒット数には数えない）"""
+        return self._entries.get(board_id)
+    
+    def peek(self, board_id):
+        """有効なエントリがあるかだけを確認する（ヒット数・LRUの順序を変えない）"""
+        entry = self._entries.get(board_id)
+        return entry is not None and time.monotonic() - entry['stored_at'] <= self.ttl
+    
+    def refresh(self, board_id):
+        """304で内容が変わっていないと確認できたエントリの期限を延長する"""
+        entry = self._entries.get(board_id)
+        if entry is not None:
+            entry['stored_at'] = time.monotonic()
+            self._entries.move_to_end(board_id)
+            self.revalidations += 1
+    
+    def put(self, board_id, result, etag=None, last_modified=None, organized=None, dangling=None):
+        if self.ttl <= 0:
+            return
+        self.discard(board_id)
+        size = estimate_result_size(result)
+        if size > self.max_bytes:
+            return
+        self._entries[board_id] = {
+            'result': result,
+            'size': size,
+            'stored_at': time.monotonic(),
+            'etag': etag,
+            'last_modified': last_modified,
+            'last_id': max((int(cid) for cid in result['comments']), default=0),
+            'organized': organized,
+            'dangling': dangling,
+            'graph': None
+        }
+        self._total_bytes += size
+        # メモリ上限を超えた分は古い順に追い出す
+        while self._total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._total_bytes -= evicted['size']
+            self.evictions += 1
+    
+    def organized_for(self, board_id, result):
+        """resultの再構成済みコメント列を返す（キャッシュ中のresultなら結果を保持して再利用）"""
+        entry = self._entries.get(board_id)
+        if entry is None or entry['result'] is not result:
+            return reorganize_comments(result['comments'])
+        if entry['organized'] is None:
+            entry['organized'] = reorganize_comments(result['comments'])
+            entry['dangling'] = find_dangling_anchors(result['comments'])
+        return entry['organized']
+    
+    def graph_for(self, board_id, result):
+        """resultの返信グラフを返す（organized_forと同じくキャッシュ中のresultなら保持して再利用）"""
+        entry = self._entries.get(board_id)
+        if entry is None or entry['result'] is not result:
+            return build_reply_graph(result['comments'])
+        if entry['graph'] is None:
+            entry['graph'] = build_reply_graph(result['comments'])
+        return entry['graph']
+    
+    def discard(self, board_id):
+        entry = self._entries.pop(board_id, None)
+        if entry is not None:
+            self._total_bytes -= entry['size']
+    
+    def stats(self):
+        lookups = self.hits + self.misses
         return {
-            'title': page_title,
-            'comments': comments,
-            'url': url
+            'entries': len(self._entries),
+            'bytes': self._total_bytes,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'revalidations': self.revalidations,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
         }
+
+thread_cache = ThreadCache()
+
+def conditional_headers(entry):
+    headers = {}
+    if entry is None:
+        return headers
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+def thread_cache_key(board_id, crawl=False, budget=False):
+    # 全ページ巡回の結果・予算モードで打ち切った結果は単一ページの結果と別に保持する
+    if crawl:
+        return f"{board_id}:all"
+    if budget:
+        return f"{board_id}:budget"
+    return board_id
+
+class SingleFlight:
+    """同じキーの同時呼び出しを1回の実行にまとめる（後から来た呼び出しは同じ結果を待つ）"""
+    
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+    
+    async def do(self, key, func):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        # 待っている呼び出しがキャンセルされても、他の呼び出しのために実行は続ける
+        return await asyncio.shield(task)
+    
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # 全員がキャンセル済みでも例外未取得の警告を出さない
+            task.exception()
+    
+    def stats(self):
+        return {
+            'in_flight': len(self._calls),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced
+        }
+
+thread_flights = SingleFlight()
+
+async def get_thread(url, crawl=False):
+    """キャッシュを優先してスレッドを取得する
+
+    同じスレッドへの同時リクエストは板IDごとに1回の取得・解析にまとめる
+    """
+    board_id = extract_board_id(url)
+    key = thread_cache_key(board_id, crawl) if board_id is not None else url
+    return await thread_flights.do(key, lambda: load_thread(url, crawl))
+
+async def load_thread(url, crawl=False):
+    """get_threadの本体
+
+    期限切れのエントリはETag/Last-Modifiedで再検証し、304なら解析をスキップして再利用する
+    """
+    board_id = extract_board_id(url)
+    if board_id is None:
+        return await crawl_thread(url) if crawl else await scrape_animanch(url)
+    if crawl:
+        key = thread_cache_key(board_id, crawl=True)
+        cached = thread_cache.get(key)
+        if cached is None:
+            cached = await crawl_thread(url)
+            thread_cache.put(key, cached)
+        return cached
+    cached = thread_cache.get(board_id)
+    if cached is not None:
+        return cached
+    
+    stale = thread_cache.get_stale(board_id)
+    if stale is None and STREAM_PARSE:
+        # 再検証するエントリがなければ、受信しながらレス単位で解析する
+        headers = {}
+        result = await scrape_animanch(url, stream=True, response_headers=headers)
+        thread_cache.put(
+            board_id,
+            result,
+            etag=headers.get('etag'),
+            last_modified=headers.get('last-modified')
+        )
+        return result
+    try:
+        response = await fetch_page(url, headers=conditional_headers(stale))
+        if response.status_code == 304 and stale is not None:
+            thread_cache.refresh(board_id)
+            return stale['result']
+        organized = dangling = None
+        if stale is not None and THREAD_INCREMENTAL_REFRESH:
+            update = await asyncio.to_thread(parse_animanch_html, response.text, url, stale['last_id'])
+            result, organized, dangling = merge_thread_update(stale, update)
+        else:
+            result = await asyncio.to_thread(parse_animanch_html, response.text, url)
     except Exception as e:
         logging.error(f"スクレイピングエラー: {e}")
         raise
+    thread_cache.put(
+        board_id,
+        result,
+        etag=response.headers.get('ETag'),
+        last_modified=response.headers.get('Last-Modified'),
+        organized=organized,
+        dangling=dangling
+    )
+    return result
+
+def get_organized_comments(result, crawl=False):
+    board_id = extract_board_id(result['url'])
+    if board_id is None:
+        return reorganize_comments(result['comments'])
+    return thread_cache.organized_for(thread_cache_key(board_id, crawl), result)
+
+def get_reply_graph(result, crawl=False):
+    board_id = extract_board_id(result['url'])
+    if board_id is None:
+        return build_reply_graph(result['comments'])
+    return thread_cache.graph_for(thread_cache_key(board_id, crawl), result)
+
+def merge_thread_update(entry, update):
+    """差分解析した新着レスをキャッシュ済みの結果にマージする
+
+    再構成済みの並びがあれば新着分だけ追記し、(result, organized, dangling)を返す
+    """
+    old_comments = entry['result']['comments']
+    comments = dict(old_comments)
+    comments.update(update['comments'])
+    result = {
+        'title': update['title'],
+        'comments': comments,
+        'url': update['url']
+    }
+    new_ids = sorted(update['comments'], key=int)
+    logging.info(f"差分更新: 新着 {len(new_ids)} 件 (既存 {len(old_comments)} 件)")
+    if entry['organized'] is None:
+        return result, None, None
+    organized = extend_reorganized_comments(entry['organized'], entry['dangling'], old_comments, comments, new_ids)
+    if organized is None:
+        return result, None, None
+    dangling = entry['dangling'] | {
+        anchor_id
+        for comment_id in new_ids
+        for anchor_id in comments[comment_id]['anchors']
+        if anchor_id not in comments
+    }
+    return result, organized, dangling
 
 def reorganize_comments(comments):
     try:
         organized_comments = []
         processed_ids = set()
-        comment_ids = sorted([int(cid) for cid in comments.keys()])
         
-        for current_id in comment_ids:
-            current_id_str = str(current_id)
-            if current_id_str in processed_ids:
+        for current_id in sorted(comments, key=int):
+            if current_id in processed_ids:
                 continue
-            organized_comments.append(comments[current_id_str])
-            processed_ids.add(current_id_str)
-            process_anchors_dfs(current_id_str, comments, organized_comments, processed_ids)
+            organized_comments.append(comments[current_id])
+            processed_ids.add(current_id)
+            process_anchors_dfs(current_id, comments, organized_comments, processed_ids)
         return organized_comments
     except Exception as e:
         logging.error(f"コメント再構成エラー: {e}")
         raise
 
 def process_anchors_dfs(comment_id, comments, organized_comments, processed_ids):
-    if comment_id not in comments:
-        return
-    anchors = comments[comment_id]['anchors']
-    for anchor_id in anchors:
-        if anchor_id in processed_ids or anchor_id not in comments:
+    """comment_idのアンカー先を、未処理のものだけ深さ優先で追加する
+
+    再帰せず、アンカー先リストのイテレータを積んだスタックでたどる（長い返信の連鎖でも深さ制限に当たらない）
+    """
+    stack = [iter(comments[comment_id]['anchors'])]
+    while stack:
+        for anchor_id in stack[-1]:
+            if anchor_id not in processed_ids and anchor_id in comments:
+                organized_comments.append(comments[anchor_id])
+                processed_ids.add(anchor_id)
+                stack.append(iter(comments[anchor_id]['anchors']))
+                break
+        else:
+            stack.pop()
+
+def build_reply_graph(comments):
+    """アンカーを逆向きにした返信の索引を作る
+
+    replies: レス番号 → そのレスにアンカーを付けたレス番号のリスト（昇順）
+    reply_counts: レス番号 → 返信数
+    parents: レス番号 → 最初に付けた実在のアンカー先（自分より前のレス）
+    subtree_sizes: parentsを親とする木での部分木のレス数（自分を含む）
+    """
+    comment_ids = sorted(comments, key=int)
+    replies = {comment_id: [] for comment_id in comment_ids}
+    parents = {}
+    for comment_id in comment_ids:
+        number = int(comment_id)
+        for anchor_id in comments[comment_id]['anchors']:
+            if anchor_id not in replies or anchor_id == comment_id:
+                continue
+            replies[anchor_id].append(comment_id)
+            if comment_id not in parents and int(anchor_id) < number:
+                parents[comment_id] = anchor_id
+    # 親は常に子より前のレスなので、後ろから足し込めば1回で部分木の大きさが決まる
+    subtree_sizes = dict.fromkeys(comment_ids, 1)
+    for comment_id in reversed(comment_ids):
+        parent_id = parents.get(comment_id)
+        if parent_id is not None:
+            subtree_sizes[parent_id] += subtree_sizes[comment_id]
+    return {
+        'replies': replies,
+        'reply_counts': {comment_id: len(reply_ids) for comment_id, reply_ids in replies.items()},
+        'parents': parents,
+        'subtree_sizes': subtree_sizes
+    }
+
+def trim_subtree(root_id, children, values, weights, budget, keep_root=False):
+    """root_idの部分木から、根と部分木の価値が高い子の連鎖をbudget文字以内で選ぶ
+
+    子は親を選んだ後にだけ候補になるので、選んだレスは根からつながったままになる。
+    keep_rootなら根だけで上限を超えても根は残す（整形時にmax_total_charsで切られる）
+    """
+    if weights[root_id] > budget and not keep_root:
+        return [], 0
+    picked = [root_id]
+    used = weights[root_id]
+    heap = [(-values[child_id], int(child_id), child_id) for child_id in children[root_id]]
+    heapify(heap)
+    while heap and used < budget:
+        _, _, child_id = heappop(heap)
+        if used + weights[child_id] > budget:
+            continue
+        picked.append(child_id)
+        used += weights[child_id]
+        for grandchild_id in children[child_id]:
+            heappush(heap, (-values[grandchild_id], int(grandchild_id), grandchild_id))
+    return picked, used
+
+def select_hot_comments(organized_comments, graph, max_total_chars=4800):
+    """返信の多い部分木を、文字数あたりの返信数が高い順にmax_total_chars以内へ詰めて返す
+
+    部分木はgraphのparentsを親とする木で数え、価値は部分木内のレスが受けた返信数の合計、
+    重さは整形される本文の文字数。重なりはオイラーツアーの区間を二分探索して判定する。
+    残りの文字数に収まらない部分木はtrim_subtreeで根と価値の高い子の連鎖だけに削って詰める。
+    返すコメントはorganized_commentsの並び順のまま（返信が1件もなければそのまま返す）
+    """
+    parents = graph['parents']
+    comment_ids = sorted(graph['reply_counts'], key=int)
+    values = dict(graph['reply_counts'])
+    if not any(values.values()):
+        return list(organized_comments)
+    own_weights = dict.fromkeys(comment_ids, 0)
+    for comment in organized_comments:
+        own_weights[comment['id']] = sum(len(text) for text in iter_comment_texts([comment]))
+    weights = dict(own_weights)
+    
+    children = {comment_id: [] for comment_id in comment_ids}
+    for comment_id in comment_ids:
+        parent_id = parents.get(comment_id)
+        if parent_id is not None:
+            children[parent_id].append(comment_id)
+    
+    # オイラーツアー: 部分木はtour[tin[v]:tout[v]]に並ぶ
+    tour = []
+    tin = {}
+    tout = {}
+    for root_id in comment_ids:
+        if root_id in parents:
+            continue
+        tin[root_id] = len(tour)
+        tour.append(root_id)
+        stack = [(root_id, iter(children[root_id]))]
+        while stack:
+            node_id, child_iter = stack[-1]
+            child_id = next(child_iter, None)
+            if child_id is None:
+                tout[node_id] = len(tour)
+                stack.pop()
+            else:
+                tin[child_id] = len(tour)
+                tour.append(child_id)
+                stack.append((child_id, iter(children[child_id])))
+    
+    # 親は常に子より前のレスなので、後ろから足し込めば部分木の合計になる
+    for comment_id in reversed(comment_ids):
+        parent_id = parents.get(comment_id)
+        if parent_id is not None:
+            values[parent_id] += values[comment_id]
+            weights[parent_id] += weights[comment_id]
+    
+    candidates = [
+        comment_id for comment_id in comment_ids
+        if values[comment_id] > 0 and weights[comment_id] > 0
+    ]
+    candidates.sort(key=lambda comment_id: (-values[comment_id] / weights[comment_id], int(comment_id)))
+    
+    selected_ids = set()
+    starts = []
+    ends = []
+    remaining = max_total_chars
+    for comment_id in candidates:
+        if remaining <= 0:
+            break
+        start, end = tin[comment_id], tout[comment_id]
+        i = bisect_right(starts, start)
+        # 選択済みの部分木に含まれる / 選択済みの部分木を含む場合は飛ばす
+        if (i > 0 and ends[i - 1] > start) or (i < len(starts) and starts[i] < end):
             continue
-        organized_comments.append(comments[anchor_id])
-        processed_ids.add(anchor_id)
-        process_anchors_dfs(anchor_id, comments, organized_comments, processed_ids)
+        if weights[comment_id] <= remaining:
+            selected_ids.update(tour[start:end])
+            remaining -= weights[comment_id]
+        else:
+            # 削った部分木も区間全体を使用済みにする（残りの子孫は根から切り離されるため選ばない）
+            picked, used = trim_subtree(
+                comment_id, children, values, own_weights, remaining, keep_root=not selected_ids
+            )
+            if not picked:
+                continue
+            selected_ids.update(picked)
+            remaining -= used
+        starts.insert(i, start)
+        ends.insert(i, end)
+    
+    return [comment for comment in organized_comments if comment['id'] in selected_ids]
+
+def find_dangling_anchors(comments):
+    """まだ存在しないレスを指すアンカーを集める（新着で埋まると並び順が変わる）"""
+    return {
+        anchor_id
+        for comment in comments.values()
+        for anchor_id in comment['anchors']
+        if anchor_id not in comments
+    }
+
+def extend_reorganized_comments(organized_comments, dangling, old_comments, comments, new_ids):
+    """reorganize_commentsの結果に新着レスだけを追記した新しいリストを返す
 
-def format_comments_simple(comments):
-    formatted_text = []
+    既存レスが新着レスを前方参照している場合は並び順が変わるためNoneを返す（全体再構成が必要）
+    """
+    if dangling.intersection(new_ids):
+        return None
+    organized = list(organized_comments)
+    # 既存レスは出力済みとして扱い、新着レスからだけたどる
+    processed_ids = set(old_comments)
+    for comment_id in new_ids:
+        if comment_id in processed_ids:
+            continue
+        organized.append(comments[comment_id])
+        processed_ids.add(comment_id)
+        process_anchors_dfs(comment_id, comments, organized, processed_ids)
+    return organized
+
+class StreamingReorganizer:
+    """レス番号の昇順に届くコメントを受け取り、reorganize_commentsと同じ順で確定した分から返す
+
+    まだ届いていない番号へのアンカーに当たったら、その番号以上のレスが届くまで出力を止める
+    """
+    
+    def __init__(self):
+        self.comments = {}
+        self._arrived = []
+        self._root_pos = 0
+        self._processed = set()
+        self._stack = []
+        self._max_id = 0
+    
+    def add(self, comment):
+        """コメントを1件追加し、新たに順番が確定したコメントのリストを返す"""
+        self.comments[comment['id']] = comment
+        self._arrived.append(comment['id'])
+        self._max_id = max(self._max_id, int(comment['id']))
+        return self._advance(final=False)
+    
+    def finish(self):
+        """入力の終わりを伝え、残りのコメントをすべて返す"""
+        return self._advance(final=True)
+    
+    def _advance(self, final):
+        ready = []
+        comments = self.comments
+        processed = self._processed
+        stack = self._stack
+        while True:
+            if stack:
+                frame = stack[-1]
+                anchors = comments[frame[0]]['anchors']
+                if frame[1] >= len(anchors):
+                    stack.pop()
+                    continue
+                anchor_id = anchors[frame[1]]
+                if anchor_id not in processed and anchor_id not in comments:
+                    if not final and int(anchor_id) > self._max_id:
+                        return ready
+                    # 届いた番号より前で見つからないレスは存在しない（削除・本文なし）
+                    frame[1] += 1
+                    continue
+                frame[1] += 1
+                if anchor_id in processed:
+                    continue
+                processed.add(anchor_id)
+                ready.append(comments[anchor_id])
+                stack.append([anchor_id, 0])
+                continue
+            while self._root_pos < len(self._arrived) and self._arrived[self._root_pos] in processed:
+                self._root_pos += 1
+            if self._root_pos == len(self._arrived):
+                return ready
+            root_id = self._arrived[self._root_pos]
+            processed.add(root_id)
+            ready.append(comments[root_id])
+            stack.append([root_id, 0])
+
+_NEWLINE_PATTERN = re.compile(r'\s*\n\s*')
+
+def iter_comment_texts(comments):
+    """コメント辞書を順に受け取り、話者付き整形に渡す本文を返す
+
+    本文中の改行は空白にまとめる（改行のまま渡すと別コメントとして扱われるため）
+    """
     for comment in comments:
         if comment['text']:
             text = comment['text'].replace('[画像あり]', '').strip()
             if text:
-                formatted_text.append(f'"{text}"')
-    return "\n".join(formatted_text)
+                if '\n' in text:
+                    text = _NEWLINE_PATTERN.sub(' ', text)
+                yield text.strip('"')
 
 def format_with_speaker(comments, length=22, max_total_chars=4800, do_split=True):
+    """commentsはリストでもイテレータでもよい（上限に達したら残りは読まない）"""
     try:
-        simple_text = format_comments_simple(comments)
-        formatted_text = add_line_breaks(
-            simple_text,
+        return '\n'.join(iter_speaker_lines(
+            iter_comment_texts(comments),
             length=length,
             max_total_chars=max_total_chars,
             do_split=do_split
-        )
-        return formatted_text
+        ))
     except Exception as e:
         logging.error(f"話者付き整形エラー: {e}")
         raise
@@ -701,6 +2212,18 @@ async def read_root():
                         <input type="url" id="url" name="url" class="form-control" 
                                placeholder="https://bbs.animanch.com/board/123456/" required>
                     </div>
+                    <div class="form-group">
+                        <label>
+                            <input type="checkbox" id="crawl" name="crawl">
+                            複数ページのスレッドを全ページ取得する
+                        </label>
+                    </div>
+                    <div class="form-group">
+                        <label>
+                            <input type="checkbox" id="hot" name="hot">
+                            返信の多いレスとその流れを優先して選ぶ
+                        </label>
+                    </div>
                     <button type="submit" class="btn btn-primary">
                         <span id="scrape-loading" class="loading hidden"></span>
                         スクレイピング開始
@@ -787,6 +2310,8 @@ async def read_root():
         document.getElementById('scrape-form').addEventListener('submit', async (e) => {
             e.preventDefault();
             const url = document.getElementById('url').value;
+            const crawl = document.getElementById('crawl').checked;
+            const selectionMode = document.getElementById('hot').checked ? 'hot' : 'order';
             
             showLoading('scrape');
             
@@ -796,7 +2321,7 @@ async def read_root():
                     headers: {
                         'Content-Type': 'application/x-www-form-urlencoded',
                     },
-                    body: `url=${encodeURIComponent(url)}`
+                    body: `url=${encodeURIComponent(url)}&crawl=${crawl}&selection_mode=${selectionMode}`
                 });
                 
                 const result = await response.text();
@@ -867,8 +2392,114 @@ async def read_root():
 </body>
 </html>""")
 
+# 一括取得の設定
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", "4"))
+BATCH_MAX_URLS = int(os.environ.get("BATCH_MAX_URLS", "20"))
+
+class ScrapeError(Exception):
+    """利用者に返すメッセージ付きのスクレイピング失敗"""
+
+# 予算モード: 出力上限に届くだけのレスを解析・再構成した時点で取得を打ち切る
+SCRAPE_BUDGET_MODE = os.environ.get("SCRAPE_BUDGET_MODE", "0") == "1"
+
+async def collect_budgeted_comments(url, max_total_chars=4800):
+    """本文の累計がmax_total_charsに届くまでだけ解析・再構成し、(タイトル, 並べ替え済みコメント)を返す
+
+    整形は上限に達した時点で止まるため、通常モードと同じ出力になる
+    """
+    reorganizer = StreamingReorganizer()
+    title = "タイトル不明"
+    organized = []
+    total_chars = 0
+    stream = stream_animanch_comments(url)
+    try:
+        async for kind, value in stream:
+            if kind == 'title':
+                title = value or title
+                continue
+            for comment in reorganizer.add(value):
+                organized.append(comment)
+                total_chars += sum(len(text) for text in iter_comment_texts([comment]))
+            if total_chars >= max_total_chars:
+                logging.info(f"予算モード: {len(reorganizer.comments)} 件で解析を打ち切りました")
+                break
+        else:
+            organized.extend(reorganizer.finish())
+    finally:
+        await stream.aclose()
+    return title, organized
+
+async def get_budgeted_thread(url):
+    """予算モードの取得結果 (タイトル, 並べ替え済みコメント) を返す
+
+    打ち切った結果は通常の結果と別のキーで同じTTLだけキャッシュする。
+    同じスレッドへの同時リクエストは1本のストリームにまとめる
+    """
+    board_id = extract_board_id(url)
+    if board_id is None:
+        return await collect_budgeted_comments(url)
+    key = thread_cache_key(board_id, budget=True)
+    return await thread_flights.do(key, lambda: load_budgeted_thread(url, key))
+
+async def load_budgeted_thread(url, key):
+    """get_budgeted_threadの本体"""
+    cached = thread_cache.get(key)
+    if cached is not None:
+        return cached['title'], thread_cache.organized_for(key, cached)
+    title, organized = await collect_budgeted_comments(url)
+    if organized:
+        # 途中までの並びは全体の再構成と一致しないことがあるので、並べ替え済みの列ごと保持する
+        result = {
+            'title': title,
+            'comments': {comment['id']: comment for comment in organized},
+            'url': url
+        }
+        thread_cache.put(key, result, organized=organized)
+    return title, organized
+
+SELECTION_MODES = ('order', 'hot')
+
+async def build_thread_output(url, crawl=False, budget=False, selection_mode='order'):
+    """1スレッド分を取得してゆっくりボイス形式に整形し、(タイトル, テキスト)を返す
+
+    budgetを指定すると（全件のキャッシュがない単一ページのスレッドは）途中で打ち切った結果を使う
+    selection_modeが'hot'なら返信の多いレスの流れを優先して選ぶ（全件が必要なのでbudgetは無視する）
+    """
+    if selection_mode not in SELECTION_MODES:
+        raise ScrapeError(f"selection_modeは {', '.join(SELECTION_MODES)} のいずれかを指定してください。")
+    board_id = extract_board_id(url)
+    if budget and selection_mode == 'order' and not crawl and (board_id is None or not thread_cache.peek(board_id)):
+        title, organized_comments = await get_budgeted_thread(url)
+        if not organized_comments:
+            raise ScrapeError("コメントが見つかりませんでした。")
+        formatted_text = format_with_speaker(organized_comments)
+        if not formatted_text or not formatted_text.strip():
+            raise ScrapeError("テキストの整形に失敗しました。")
+        return title, formatted_text
+    
+    scraped_data = await get_thread(url, crawl=crawl)
+    if not scraped_data or not scraped_data['comments']:
+        raise ScrapeError("コメントが見つかりませんでした。")
+    
+    organized_comments = get_organized_comments(scraped_data, crawl=crawl)
+    if not organized_comments:
+        raise ScrapeError("コメントの処理に失敗しました。")
+    if selection_mode == 'hot':
+        organized_comments = select_hot_comments(organized_comments, get_reply_graph(scraped_data, crawl=crawl))
+    
+    formatted_text = format_with_speaker(organized_comments)
+    if not formatted_text or not formatted_text.strip():
+        raise ScrapeError("テキストの整形に失敗しました。")
+    
+    return scraped_data['title'], formatted_text
+
 @app.post("/api/scrape")
-async def scrape_url(url: str = Form(...)):
+async def scrape_url(
+    url: str = Form(...),
+    crawl: bool = Form(default=False),
+    budget: bool = Form(default=SCRAPE_BUDGET_MODE),
+    selection_mode: str = Form(default='order')
+):
     try:
         if not url or not url.strip():
             return "URLが入力されていません。"
@@ -877,27 +2508,242 @@ async def scrape_url(url: str = Form(...)):
         if not url.startswith('https://bbs.animanch.com/board/'):
             return "無効なURLです。あにまんchの掲示板URLを入力してください。"
         
-        scraped_data = await scrape_animanch(url)
-        if not scraped_data or not scraped_data['comments']:
-            return "コメントが見つかりませんでした。"
-        
-        organized_comments = reorganize_comments(scraped_data['comments'])
-        if not organized_comments:
-            return "コメントの処理に失敗しました。"
-        
-        formatted_text = format_with_speaker(organized_comments)
-        if not formatted_text or not formatted_text.strip():
-            return "テキストの整形に失敗しました。"
-        
+        _, formatted_text = await build_thread_output(
+            url, crawl=crawl, budget=budget, selection_mode=selection_mode
+        )
         return formatted_text
         
-    except requests.exceptions.RequestException as e:
+    except ScrapeError as e:
+        return str(e)
+    except httpx.HTTPError as e:
         logging.error(f"ネットワークエラー: {e}")
         return f"ネットワークエラーが発生しました。しばらくしてから再試行してください。"
     except Exception as e:
         logging.error(f"スクレイピング処理エラー: {e}")
         return f"処理中にエラーが発生しました。\nエラー詳細: {str(e)[:100]}..."
 
+@app.post("/api/scrape/batch")
+async def scrape_batch(
+    urls: str = Form(...),
+    crawl: bool = Form(default=False),
+    budget: bool = Form(default=SCRAPE_BUDGET_MODE),
+    selection_mode: str = Form(default='order')
+):
+    """貼り付けたテキスト中の複数URLを並列に取得し、URLごとの結果とエラーをまとめて返す"""
+    # 末尾の「/」やhttp/httpsの違いだけのURLは同じスレッドなので、板IDで重複を除く（最初のURLを使う）
+    board_urls = {}
+    for url in detect_animanch_urls(urls or ""):
+        board_urls.setdefault(extract_board_id(url), url)
+    url_list = list(board_urls.values())
+    if not url_list:
+        return JSONResponse(status_code=400, content={"error": "あにまんchのURLが見つかりませんでした。"})
+    if len(url_list) > BATCH_MAX_URLS:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"URLが多すぎます。{BATCH_MAX_URLS}件以下にしてください。"}
+        )
+    
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    
+    async def run(url):
+        async with semaphore:
+            try:
+                title, output = await build_thread_output(
+                    url, crawl=crawl, budget=budget, selection_mode=selection_mode
+                )
+                return {"url": url, "title": title, "output": output}
+            except ScrapeError as e:
+                return {"url": url, "error": str(e)}
+            except httpx.HTTPError as e:
+                logging.error(f"ネットワークエラー: {url}: {e}")
+                return {"url": url, "error": "ネットワークエラーが発生しました。"}
+            except Exception as e:
+                logging.error(f"一括スクレイピングエラー: {url}: {e}")
+                return {"url": url, "error": f"処理中にエラーが発生しました。エラー詳細: {str(e)[:100]}"}
+    
+    results = await asyncio.gather(*(run(url) for url in url_list))
+    succeeded = sum(1 for result in results if "output" in result)
+    return {
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded
+    }
+
+# バックグラウンドのスクレイピングジョブ（登録後すぐにIDを返し、結果はポーリングで取得する）
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", "100"))
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", "600"))
+# ワーカーと結果は1つのプロセスのメモリにあるため、常駐プロセス（Railway / Docker）でだけ使える。
+# Vercelなどのサーバーレス環境では呼び出しやインスタンスをまたいで残らないので既定で無効にする
+SERVERLESS = bool(os.environ.get("VERCEL") or os.environ.get("AWS_LAMBDA_FUNCTION_NAME"))
+JOBS_ENABLED = os.environ.get("JOBS_ENABLED", "0" if SERVERLESS else "1") == "1"
+
+class ScrapeJobQueue:
+    """asyncio.Queueと固定数のワーカーでbuild_thread_outputを実行し、結果をTTL付きで保持する"""
+    
+    def __init__(self, workers=JOB_WORKERS, max_queue=JOB_QUEUE_SIZE, ttl=JOB_RESULT_TTL):
+        self.workers = max(workers, 1)
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self._queue = None
+        self._tasks = []
+        self._jobs = {}
+        self.busy = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+    
+    def start(self):
+        """ワーカーを起動する（起動済みなら何もしない。イベントループ内で呼ぶこと）"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logging.info(f"スクレイピングジョブのワーカーを起動しました (workers={self.workers}, queue={self.max_queue})")
+    
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+    
+    def submit(self, url, crawl=False, budget=False, selection_mode='order'):
+        """ジョブを登録して返す（キューが満杯ならNone）"""
+        self.start()
+        self._prune()
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': 'queued',
+            'url': url,
+            'params': {'crawl': crawl, 'budget': budget, 'selection_mode': selection_mode},
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'title': None,
+            'output': None,
+            'error': None,
+            '_expires_at': None
+        }
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return None
+        self._jobs[job['id']] = job
+        return job
+    
+    def get(self, job_id):
+        self._prune()
+        return self._jobs.get(job_id)
+    
+    def _prune(self):
+        """保持期限を過ぎた完了済みジョブを捨てる"""
+        now = time.monotonic()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job['_expires_at'] is not None and job['_expires_at'] <= now
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+    
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self.busy += 1
+            job['status'] = 'running'
+            job['started_at'] = datetime.now().isoformat()
+            try:
+                job['title'], job['output'] = await build_thread_output(job['url'], **job['params'])
+                job['status'] = 'done'
+                self.completed += 1
+            except ScrapeError as e:
+                self._fail(job, str(e))
+            except httpx.HTTPError as e:
+                logging.error(f"ネットワークエラー: {job['url']}: {e}")
+                self._fail(job, "ネットワークエラーが発生しました。しばらくしてから再試行してください。")
+            except asyncio.CancelledError:
+                self._fail(job, "サーバーの停止によりジョブが中断されました。")
+                raise
+            except Exception as e:
+                logging.error(f"スクレイピングジョブエラー: {job['url']}: {e}")
+                self._fail(job, f"処理中にエラーが発生しました。エラー詳細: {str(e)[:100]}")
+            finally:
+                job['finished_at'] = datetime.now().isoformat()
+                job['_expires_at'] = time.monotonic() + self.ttl
+                self.busy -= 1
+                self._queue.task_done()
+    
+    def _fail(self, job, message):
+        job['status'] = 'failed'
+        job['error'] = message
+        self.failed += 1
+    
+    def stats(self):
+        self._prune()
+        return {
+            'workers': self.workers,
+            'busy': self.busy,
+            'utilization': round(self.busy / self.workers, 3),
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'max_queue': self.max_queue,
+            'retained_jobs': len(self._jobs),
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'ttl': self.ttl
+        }
+
+scrape_jobs = ScrapeJobQueue()
+
+def public_job(job):
+    """内部用のキーを除いたジョブ情報"""
+    return {key: value for key, value in job.items() if not key.startswith('_')}
+
+def jobs_unavailable():
+    return JSONResponse(
+        status_code=501,
+        content={"error": "この環境ではバックグラウンドジョブを利用できません。/api/scrape を使用してください。"}
+    )
+
+@app.post("/api/jobs")
+async def submit_scrape_job(
+    url: str = Form(...),
+    crawl: bool = Form(default=False),
+    budget: bool = Form(default=SCRAPE_BUDGET_MODE),
+    selection_mode: str = Form(default='order')
+):
+    """スクレイピングをジョブとして登録し、すぐにジョブIDを返す"""
+    if not JOBS_ENABLED:
+        return jobs_unavailable()
+    url = (url or "").strip()
+    if not url.startswith('https://bbs.animanch.com/board/'):
+        return JSONResponse(status_code=400, content={"error": "無効なURLです。あにまんchの掲示板URLを入力してください。"})
+    if selection_mode not in SELECTION_MODES:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"selection_modeは {', '.join(SELECTION_MODES)} のいずれかを指定してください。"}
+        )
+    job = scrape_jobs.submit(url, crawl=crawl, budget=budget, selection_mode=selection_mode)
+    if job is None:
+        return JSONResponse(status_code=503, content={"error": "ジョブが混み合っています。しばらくしてから再試行してください。"})
+    return JSONResponse(status_code=202, content={"job_id": job['id'], "status": job['status']})
+
+@app.get("/api/jobs/stats")
+async def scrape_job_stats():
+    if not JOBS_ENABLED:
+        return jobs_unavailable()
+    return scrape_jobs.stats()
+
+@app.get("/api/jobs/{job_id}")
+async def get_scrape_job(job_id: str):
+    if not JOBS_ENABLED:
+        return jobs_unavailable()
+    job = scrape_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "ジョブが見つかりません（期限切れの可能性があります）。"})
+    return public_job(job)
+
 @app.post("/api/process")
 async def process_text(text: str = Form(...), split_text: bool = Form(default=True)):
     try:
@@ -917,12 +2763,20 @@ async def process_text(text: str = Form(...), split_text: bool = Form(default=Tr
         if not cleaned_text or not cleaned_text.strip():
             return "クリーニング後のテキストが空になりました。"
         
+        presplit = None
+        if split_text and ginza_segmenter.enabled:
+            targets = collect_split_targets(cleaned_text, max_total_chars=4800)
+            splits = await ginza_segmenter.split_many(targets)
+            if splits:
+                presplit = dict(zip(targets, splits))
+        
         try:
             formatted_text = add_line_breaks(
                 cleaned_text,
                 length=22,
                 max_total_chars=4800,
-                do_split=split_text
+                do_split=split_text,
+                presplit=presplit
             )
         except Exception as e:
             logging.error(f"テキスト整形エラー: {e}")
@@ -938,6 +2792,79 @@ async def process_text(text: str = Form(...), split_text: bool = Form(default=Tr
         logging.error(f"テキスト処理エラー: {e}")
         return f"処理中にエラーが発生しました。\nエラー詳細: {str(e)[:100]}..."
 
+def sse_event(event, data):
+    """Server-Sent Eventsの1イベント分の文字列（dataはJSONにする）"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/process/stream")
+async def process_text_stream(text: str = Form(...), split_text: bool = Form(default=True)):
+    """/api/processのストリーミング版（Server-Sent Events）
+
+    start → 整形済みの行ごとのline（dataは行のJSON文字列）→ done の順に送る。
+    出力全体はサーバー側に溜めず、できた行から送る
+    """
+    if not text or not text.strip():
+        return JSONResponse(status_code=400, content={"error": "テキストが入力されていません。"})
+    text = text.strip()
+    if len(text) > 50000:
+        return JSONResponse(status_code=400, content={"error": "テキストが長すぎます。50,000文字以下にしてください。"})
+    
+    async def events():
+        # 入力の大きさに関係なく、最初のイベントはすぐに返す
+        yield sse_event("start", {"length": len(text)})
+        try:
+            cleaned_text = await asyncio.to_thread(clean_text, text)
+            presplit = None
+            if split_text and ginza_segmenter.enabled:
+                targets = collect_split_targets(cleaned_text, max_total_chars=4800)
+                splits = await ginza_segmenter.split_many(targets)
+                if splits:
+                    presplit = dict(zip(targets, splits))
+            
+            line_count = 0
+            for line in iter_speaker_lines(
+                iter_text_lines(cleaned_text),
+                length=22,
+                max_total_chars=4800,
+                do_split=split_text,
+                presplit=presplit
+            ):
+                yield sse_event("line", line)
+                line_count += 1
+                # 分割処理が続いてもイベントループを占有しない
+                await asyncio.sleep(0)
+            yield sse_event("done", {"lines": line_count})
+        except Exception as e:
+            logging.error(f"テキスト処理(ストリーミング)エラー: {e}")
+            yield sse_event("error", {"message": f"処理中にエラーが発生しました。エラー詳細: {str(e)[:100]}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/thread/{board_id}/graph")
+async def thread_graph(board_id: str, crawl: bool = False):
+    """スレッドの返信グラフ（返信一覧・返信数・部分木の大きさ）をキャッシュから返す"""
+    if not board_id.isdigit():
+        return JSONResponse(status_code=400, content={"error": "板IDは数字で指定してください。"})
+    url = f"https://bbs.animanch.com/board/{board_id}/"
+    try:
+        result = await get_thread(url, crawl=crawl)
+    except httpx.HTTPError as e:
+        logging.error(f"ネットワークエラー: {url}: {e}")
+        return JSONResponse(status_code=502, content={"error": "ネットワークエラーが発生しました。"})
+    if not result or not result['comments']:
+        return JSONResponse(status_code=404, content={"error": "コメントが見つかりませんでした。"})
+    graph = get_reply_graph(result, crawl=crawl)
+    return {
+        "board_id": board_id,
+        "title": result['title'],
+        "comment_count": len(result['comments']),
+        **graph
+    }
+
 @app.get("/api/health")
 async def health_check():
     try:
@@ -952,7 +2879,13 @@ async def health_check():
             "version": "1.0.0",
             "python_version": sys.version,
             "port": port,
-            "environment": "production" if port != "8000" else "development"
+            "environment": "production" if port != "8000" else "development",
+            "thread_cache": thread_cache.stats(),
+            "ginza_segmenter": ginza_segmenter.stats(),
+            "segment_cache": segment_cache.stats(),
+            "scrape_jobs": scrape_jobs.stats(),
+            "thread_flights": thread_flights.stats(),
+            "host_schedulers": {host: scheduler.stats() for host, scheduler in _host_schedulers.items()}
         }
     except Exception as e:
         logging.error(f"Health check failed: {e}", exc_info=True)
@@ -0,0 +1,54 @@
+"""add_line_breaksの折り返し処理のマイクロベンチマーク
+
+使い方: python benchmarks/bench_line_breaks.py
+"""
+import os
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api.index import wrap_line, add_line_breaks  # noqa: E402
+
+TEXT_LENGTH = 50000
+REPEAT = 5
+
+def wrap_line_by_char(text, length=22):
+    """旧実装（1文字ずつ足して長さを確認する）"""
+    lines = []
+    current_line = ''
+    for char in text:
+        current_line += char
+        if len(current_line) >= length:
+            lines.append(current_line)
+            current_line = ''
+    if current_line:
+        lines.append(current_line)
+    return lines
+
+def make_text(length, seed=0):
+    rng = random.Random(seed)
+    alphabet = 'あいうえおかきくけこさしすせそたちつてとはがをにでの、。！？'
+    return ''.join(rng.choice(alphabet) for _ in range(length))
+
+def bench(label, func):
+    best = min(timeit.repeat(func, number=1, repeat=REPEAT))
+    print(f"{label:<28} {best * 1000:9.2f} ms")
+    return best
+
+def main():
+    text = make_text(TEXT_LENGTH)
+    assert wrap_line(text) == wrap_line_by_char(text)
+
+    print(f"入力: {TEXT_LENGTH}文字 (最良値 / {REPEAT}回)")
+    old = bench("1文字ずつ連結", lambda: wrap_line_by_char(text))
+    new = bench("スライス", lambda: wrap_line(text))
+    print(f"速度比: {old / new:.1f}x")
+
+    # コメント単位の入力（80文字以下なので分割は走らない）でadd_line_breaks全体を測る
+    comments = '\n'.join(text[i:i + 80] for i in range(0, len(text), 80))
+    bench("add_line_breaks (全体)", lambda: add_line_breaks(comments, max_total_chars=TEXT_LENGTH))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""reorganize_comments / extend_reorganized_commentsのベンチマーク（深い返信の連鎖を含む1万レスの合成スレッド）
+
+使い方: python benchmarks/bench_reorganize.py
+"""
+import os
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api.index import (  # noqa: E402
+    reorganize_comments, extend_reorganized_comments, find_dangling_anchors
+)
+
+COMMENT_COUNT = 10000
+NEW_COMMENT_COUNT = 10
+REPEAT = 5
+
+def reorganize_comments_recursive(comments):
+    """旧実装（文字列のレス番号と再帰によるDFS）"""
+    organized_comments = []
+    processed_ids = set()
+    for current_id in sorted([int(cid) for cid in comments.keys()]):
+        current_id_str = str(current_id)
+        if current_id_str in processed_ids:
+            continue
+        organized_comments.append(comments[current_id_str])
+        processed_ids.add(current_id_str)
+        process_anchors_dfs_recursive(current_id_str, comments, organized_comments, processed_ids)
+    return organized_comments
+
+def process_anchors_dfs_recursive(comment_id, comments, organized_comments, processed_ids):
+    if comment_id not in comments:
+        return
+    for anchor_id in comments[comment_id]['anchors']:
+        if anchor_id in processed_ids or anchor_id not in comments:
+            continue
+        organized_comments.append(comments[anchor_id])
+        processed_ids.add(anchor_id)
+        process_anchors_dfs_recursive(anchor_id, comments, organized_comments, processed_ids)
+
+def make_comments(count, chain_length=2000, seed=0):
+    """長い返信の連鎖（前方参照で数千段続くもの）と、ランダムな後方アンカーを混ぜた合成スレッド"""
+    rng = random.Random(seed)
+    comments = {}
+    for i in range(1, count + 1):
+        anchors = []
+        # chain_lengthレスごとに区切った連鎖（各レスが次のレスを参照する）
+        if i % chain_length and i < count:
+            anchors.append(str(i + 1))
+        for _ in range(rng.randint(0, 2)):
+            anchors.append(str(rng.randint(1, i)))
+        comments[str(i)] = {'id': str(i), 'text': 'テスト', 'anchors': list(dict.fromkeys(anchors))}
+    return comments
+
+def bench(label, func):
+    best = min(timeit.repeat(func, number=1, repeat=REPEAT))
+    print(f"{label:<32} {best * 1000:9.2f} ms")
+    return best
+
+def main():
+    comments = make_comments(COMMENT_COUNT)
+    try:
+        reorganize_comments_recursive(comments)
+        print("再帰DFS: 既定の再帰上限で完了")
+    except RecursionError:
+        print(f"再帰DFS: 既定の再帰上限 ({sys.getrecursionlimit()}) でRecursionError")
+    # 旧実装は連鎖の長さだけ再帰するので、比較のために再帰上限を引き上げる
+    sys.setrecursionlimit(COMMENT_COUNT * 4)
+    expected = [comment['id'] for comment in reorganize_comments_recursive(comments)]
+    assert [comment['id'] for comment in reorganize_comments(comments)] == expected
+
+
+    print(f"入力: {COMMENT_COUNT}レス (最良値 / {REPEAT}回)")
+    old = bench("再帰DFS", lambda: reorganize_comments_recursive(comments))
+    new = bench("明示スタック", lambda: reorganize_comments(comments))
+    print(f"速度比: {old / new:.1f}x")
+
+    # 差分更新: 末尾のNEW_COMMENT_COUNTレスを新着として、既存の並びに追記する
+    new_ids = [str(i) for i in range(COMMENT_COUNT - NEW_COMMENT_COUNT + 1, COMMENT_COUNT + 1)]
+    old_comments = {comment_id: comments[comment_id] for comment_id in comments if comment_id not in new_ids}
+    organized = reorganize_comments(old_comments)
+    dangling = find_dangling_anchors(old_comments) - set(new_ids)
+    extended = extend_reorganized_comments(organized, dangling, old_comments, comments, new_ids)
+    assert [comment['id'] for comment in extended] == [comment['id'] for comment in reorganize_comments(comments)]
+    print(f"差分更新: 既存 {len(old_comments)}レス + 新着 {NEW_COMMENT_COUNT}レス")
+    full = bench("全体を再構成", lambda: reorganize_comments(comments))
+    incremental = bench("新着だけ追記", lambda: extend_reorganized_comments(organized, dangling, old_comments, comments, new_ids))
+    print(f"速度比: {full / incremental:.1f}x")
+
+if __name__ == "__main__":
+    main()
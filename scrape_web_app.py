@@ -1,7 +1,10 @@
 import os
 import re
 import logging
-import requests
+import time
+import random
+from email.utils import parsedate_to_datetime
+import httpx
 from bs4 import BeautifulSoup, NavigableString
 from datetime import datetime
 # spaCy + ginzaを削除してルールベース処理のみ使用
@@ -10,6 +13,7 @@ from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import asyncio
+from bisect import bisect_right
 import json
 from typing import Dict, List
 import uvicorn
@@ -54,38 +58,52 @@ def split_long_text(text, max_length=80, min_length=30):
         # 最も基本的な分割にフォールバック
         return simple_split(text, max_length)
 
+# 区切り候補と優先度（improved_rule_based_splitは先頭から見て最初に条件を満たしたものを採るため、スコアの高い順に並べること）
+RULE_BREAK_CHARS = [
+    ('。', 100), ('！', 100), ('？', 100),
+    ('、', 80), ('，', 80),
+    ('ので', 70), ('から', 70), ('けれど', 70),
+    ('という', 60), ('ところ', 60),
+    ('について', 50), ('に対して', 50),
+    ('は', 40), ('が', 40), ('を', 40), ('に', 40),
+    ('と', 30), ('で', 30), ('の', 30)
+]
+
+def find_break_positions(text, break_chars=RULE_BREAK_CHARS):
+    """区切り候補ごとの出現位置（昇順）をまとめて求める"""
+    positions = []
+    for bc, _ in break_chars:
+        found = []
+        pos = text.find(bc)
+        while pos != -1:
+            found.append(pos)
+            pos = text.find(bc, pos + 1)
+        positions.append(found)
+    return positions
+
 def improved_rule_based_split(text, max_length=80):
-    break_chars = [
-        ('。', 100), ('！', 100), ('？', 100),
-        ('、', 80), ('，', 80),
-        ('ので', 70), ('から', 70), ('けれど', 70),
-        ('という', 60), ('ところ', 60),
-        ('について', 50), ('に対して', 50),
-        ('は', 40), ('が', 40), ('を', 40), ('に', 40),
-        ('と', 30), ('で', 30), ('の', 30)
-    ]
+    """max_length文字の窓ごとに、窓の後半にある最も優先度の高い区切りで切る
+
+    区切り候補の位置を先に求めて二分探索で引くので、
+    1文字ずつ足してrfindし直していた旧実装と同じ結果を線形時間で返す
+    """
+    window = max(max_length, 1)
+    positions = find_break_positions(text)
     result = []
-    current_text = ""
-    i = 0
-    while i < len(text):
-        current_text += text[i]
-        if len(current_text) >= max_length:
-            best_pos = -1
-            best_score = 0
-            for bc, score in break_chars:
-                pos = current_text.rfind(bc)
-                if pos > len(current_text)//2 and score > best_score:
-                    best_pos = pos + len(bc)
-                    best_score = score
-            if best_pos > 0:
-                result.append(current_text[:best_pos])
-                current_text = current_text[best_pos:]
-            else:
-                result.append(current_text)
-                current_text = ""
-        i += 1
-    if current_text:
-        result.append(current_text)
+    start = 0
+    while len(text) - start >= window:
+        end = start + window
+        cut = end
+        for (bc, _), found in zip(RULE_BREAK_CHARS, positions):
+            # 窓に収まる最後の出現位置（旧実装のrfindに相当）
+            idx = bisect_right(found, end - len(bc)) - 1
+            if idx >= 0 and found[idx] - start > window // 2:
+                cut = found[idx] + len(bc)
+                break
+        result.append(text[start:cut])
+        start = cut
+    if start < len(text):
+        result.append(text[start:])
     return result
 
 def absorb_short_lines(blocks, min_length=30):
@@ -172,6 +190,42 @@ def clean_text(text):
         raise
 
 # 改行追加とキャラクター挿入
+def wrap_line(text, length=22):
+    """textをlength文字ごとに区切った行のリストを返す"""
+    step = max(length, 1)
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
+def iter_speaker_lines(texts, length=22, max_total_chars=20000, do_split=True):
+    """本文を1件ずつ受け取り、話者付きの行（話者<TAB>"本文"<TAB>文字数）を順に返す
+
+    max_total_charsに達したら終了する。WebSocketで1行ずつ送るために使う
+    """
+    characters = ['ゆっくり霊夢', 'ゆっくり魔理沙', 'ゆっくり妖夢']
+    char_index = 0
+    total_chars = 0
+    
+    for comment in texts:
+        current_char = characters[char_index]
+        char_index = (char_index + 1) % len(characters)
+        
+        if do_split and len(comment) > 80:
+            split_comments = split_long_text(comment)
+        else:
+            split_comments = [comment]
+        
+        for split_comment in split_comments:
+            comment_lines = wrap_line(split_comment, length)
+            
+            if comment_lines:
+                comment_text = chr(10).join(comment_lines)
+                comment_length = len(split_comment)
+                
+                if total_chars + comment_length > max_total_chars and total_chars > 0:
+                    return
+                
+                yield f'{current_char}\t"{comment_text}"\t{comment_length}'
+                total_chars += comment_length
+
 def add_line_breaks(text, length=22, max_total_chars=20000, do_split=True):
     """改行の追加とキャラクター名の挿入、文字数制限付き（ゆっくりボイス版のみ）"""
     try:
@@ -193,15 +247,7 @@ def add_line_breaks(text, length=22, max_total_chars=20000, do_split=True):
                 split_comments = [comment]
             
             for split_comment in split_comments:
-                comment_lines = []
-                current_line = ''
-                for char in split_comment:
-                    current_line += char
-                    if len(current_line) >= length:
-                        comment_lines.append(current_line)
-                        current_line = ''
-                if current_line:
-                    comment_lines.append(current_line)
+                comment_lines = wrap_line(split_comment, length)
                 
                 if comment_lines:
                     comment_text = chr(10).join(comment_lines)
@@ -219,178 +265,331 @@ def add_line_breaks(text, length=22, max_total_chars=20000, do_split=True):
         logging.error(f"改行追加処理でエラー発生: {e}")
         raise
 
+# 共有HTTPクライアント（接続をリクエスト間で再利用し、イベントループをブロックしない）
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
+}
+FETCH_TIMEOUT = 15
+
+# 接続プール設定（環境変数で調整可能）
+HTTP_POOL_SIZE = int(os.environ.get("ANIMANCH_POOL_SIZE", "20"))
+HTTP_MAX_PER_HOST = int(os.environ.get("ANIMANCH_MAX_PER_HOST", "6"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("ANIMANCH_KEEPALIVE_EXPIRY", "30"))
+# ホストごとのレート制限と再試行（api/index.pyと同じ環境変数）
+HOST_RATE = float(os.environ.get("ANIMANCH_RATE", "5"))
+HOST_BURST = float(os.environ.get("ANIMANCH_BURST", "5"))
+FETCH_RETRIES = int(os.environ.get("ANIMANCH_RETRIES", "3"))
+FETCH_BACKOFF_BASE = float(os.environ.get("ANIMANCH_BACKOFF_BASE", "0.5"))
+FETCH_BACKOFF_MAX = float(os.environ.get("ANIMANCH_BACKOFF_MAX", "30"))
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# h2がインストールされていればHTTP/2を使う
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_http_client = None
+_host_semaphores = {}
+_host_limiters = {}
+
+def get_http_client():
+    """プロセス共有の非同期HTTPクライアントを返す（初回呼び出し時に生成）"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            timeout=FETCH_TIMEOUT,
+            follow_redirects=True,
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_SIZE,
+                max_keepalive_connections=HTTP_POOL_SIZE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            )
+        )
+    return _http_client
+
+def get_host_semaphore(host):
+    """ホスト単位の同時接続数を制限するセマフォを返す"""
+    semaphore = _host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(HTTP_MAX_PER_HOST)
+        _host_semaphores[host] = semaphore
+    return semaphore
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+class HostRateLimiter:
+    """1ホスト分のトークンバケット（送信予定時刻を予約する方式）と、Retry-Afterによる停止"""
+    
+    def __init__(self, rate=HOST_RATE, burst=HOST_BURST):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.blocked_until = 0.0
+        self._next = 0.0
+    
+    def reserve(self, max_wait=None):
+        """次の1リクエストの枠を予約し、送信まで待つ秒数を返す（停止がmax_waitより長ければhttpx.HTTPError）"""
+        now = time.monotonic()
+        if max_wait is not None and self.blocked_until - now > max_wait:
+            raise httpx.HTTPError(f"Retry-Afterにより {self.blocked_until - now:.0f}秒間リクエストを停止中です")
+        if self.rate <= 0:
+            return max(self.blocked_until - now, 0.0)
+        interval = 1 / self.rate
+        start = max(now, self.blocked_until, self._next - (self.burst - 1) * interval)
+        self._next = max(start, self._next) + interval
+        return start - now
+    
+    def throttle(self, retry_after=None):
+        """429/5xxを受けたときに呼ぶ（Retry-Afterがあればその間は予約を止める）"""
+        now = time.monotonic()
+        if retry_after is not None:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+        if self.rate > 0:
+            # 制限が明けた直後にまとめて送らないよう、バースト分の余裕をなくして一定間隔で再開する
+            self._next = max(self._next, max(now, self.blocked_until) + (self.burst - 1) / self.rate)
+
+def get_host_limiter(host):
+    """ホストごとのレート制限を返す（初回呼び出し時に生成）"""
+    limiter = _host_limiters.get(host)
+    if limiter is None:
+        limiter = HostRateLimiter()
+        _host_limiters[host] = limiter
+    return limiter
+
+def parse_retry_after(value):
+    """Retry-Afterヘッダー（秒数またはHTTP日付）を秒数にする（解釈できなければNone）"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(retry_at.tzinfo)).total_seconds(), 0.0)
+
+def backoff_delay(attempt):
+    """再試行までの待ち時間（指数バックオフにフルジッターをかける）"""
+    return random.uniform(0, min(FETCH_BACKOFF_MAX, FETCH_BACKOFF_BASE * (2 ** attempt)))
+
+async def fetch_page(url):
+    """レート制限を守ってページを取得する（429/5xxと通信エラーはRetry-Afterまたはジッター付きの待ち時間で再試行）"""
+    client = get_http_client()
+    host = httpx.URL(url).host
+    limiter = get_host_limiter(host)
+    for attempt in range(FETCH_RETRIES + 1):
+        await asyncio.sleep(limiter.reserve(FETCH_BACKOFF_MAX))
+        try:
+            async with get_host_semaphore(host):
+                response = await client.get(url)
+        except httpx.TransportError as e:
+            if attempt == FETCH_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            logging.warning(f"通信エラーのため{delay:.1f}秒後に再試行します ({attempt + 1}/{FETCH_RETRIES}): {url}: {e}")
+        else:
+            if response.status_code not in RETRYABLE_STATUS:
+                response.raise_for_status()
+                return response
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            limiter.throttle(retry_after)
+            # 待ち時間が長すぎるRetry-Afterは待たずに失敗させる
+            if attempt == FETCH_RETRIES or (retry_after is not None and retry_after > FETCH_BACKOFF_MAX):
+                response.raise_for_status()
+            if retry_after is not None:
+                # 次のreserveがRetry-Afterの時刻まで待つ
+                logging.warning(f"HTTP {response.status_code} のため{retry_after:.1f}秒後に再試行します ({attempt + 1}/{FETCH_RETRIES}): {url}")
+                continue
+            delay = backoff_delay(attempt)
+            logging.warning(f"HTTP {response.status_code} のため{delay:.1f}秒後に再試行します ({attempt + 1}/{FETCH_RETRIES}): {url}")
+        await asyncio.sleep(delay)
+
+# WebSocketで送る進捗の段階と、進捗バーの目安（%）
+SCRAPE_STAGES = {'fetch': 25, 'parse': 50, 'reorganize': 75, 'format': 100}
+
+async def send_progress(websocket, stage, message):
+    await websocket.send_text(json.dumps({
+        "type": "progress",
+        "stage": stage,
+        "percent": SCRAPE_STAGES[stage],
+        "message": message
+    }))
+
 # スクレイピング機能
 async def scrape_animanch(url, websocket: WebSocket = None):
     """あにまんchの掲示板ページからコメントを抽出する"""
     try:
         if websocket:
-            await websocket.send_text(json.dumps({"type": "progress", "message": "ページの取得を開始しています..."}))
+            await send_progress(websocket, "fetch", "ページの取得を開始しています...")
         
         logging.info(f"ページの取得を開始: {url}")
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
-        }
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
+        response = await fetch_page(url)
         
         if websocket:
-            await websocket.send_text(json.dumps({"type": "progress", "message": "ページの解析中..."}))
+            await send_progress(websocket, "parse", "ページの解析中...")
         
         logging.info(f"ページの取得に成功。ステータスコード: {response.status_code}")
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # ページタイトルを取得
-        title_element = soup.find('title')
-        page_title = title_element.text.strip() if title_element else "タイトル不明"
+        # HTML解析はCPU処理なのでスレッドに逃がしてイベントループを空ける
+        result = await asyncio.to_thread(parse_animanch_html, response.text, url)
         
-        thread_title_element = soup.select_one('#threadTitle')
-        if thread_title_element:
-            thread_title_text = ""
-            for node in thread_title_element.contents:
-                if isinstance(node, (str, NavigableString)):
-                    text_content = str(node).strip()
-                    if text_content:
-                        thread_title_text += text_content
-                else:
-                    break
-            
-            if not thread_title_text:
-                thread_title_text = thread_title_element.get_text().strip()
-                thread_title_text = re.sub(r'(共有|シェア|お気に入り|ブックマーク).*$', '', thread_title_text).strip()
-                thread_title_text = re.sub(r'(favorite|share|bookmark).*$', '', thread_title_text, flags=re.IGNORECASE).strip()
-            
-            if thread_title_text:
-                page_title = thread_title_text
-                logging.info(f"スレッドタイトルを取得: {page_title}")
+        if websocket:
+            await send_progress(websocket, "reorganize", "コメントの整理中...")
         
+        return result
+    except Exception as e:
         if websocket:
-            await websocket.send_text(json.dumps({"type": "progress", "message": "コメントの抽出中..."}))
+            await websocket.send_text(json.dumps({"type": "error", "message": f"エラーが発生しました: {str(e)}"}))
+        logging.error(f"スクレイピング中にエラー発生: {e}", exc_info=True)
+        raise
+
+def parse_animanch_html(html, url):
+    """取得済みHTMLからタイトルとコメントを抽出する"""
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # ページタイトルを取得
+    title_element = soup.find('title')
+    page_title = title_element.text.strip() if title_element else "タイトル不明"
+    
+    thread_title_element = soup.select_one('#threadTitle')
+    if thread_title_element:
+        thread_title_text = ""
+        for node in thread_title_element.contents:
+            if isinstance(node, (str, NavigableString)):
+                text_content = str(node).strip()
+                if text_content:
+                    thread_title_text += text_content
+            else:
+                break
         
-        comments = {}
-        comment_items = soup.select('li.list-group-item')
-        logging.info(f"コメントアイテム数: {len(comment_items)}")
+        if not thread_title_text:
+            thread_title_text = thread_title_element.get_text().strip()
+            thread_title_text = re.sub(r'(共有|シェア|お気に入り|ブックマーク).*$', '', thread_title_text).strip()
+            thread_title_text = re.sub(r'(favorite|share|bookmark).*$', '', thread_title_text, flags=re.IGNORECASE).strip()
         
-        for i, item in enumerate(comment_items):
-            if websocket and i % 10 == 0:
-                progress = int((i / len(comment_items)) * 100)
-                await websocket.send_text(json.dumps({"type": "progress", "message": f"コメント処理中... {progress}%"}))
+        if thread_title_text:
+            page_title = thread_title_text
+            logging.info(f"スレッドタイトルを取得: {page_title}")
+    
+    comments = {}
+    comment_items = soup.select('li.list-group-item')
+    logging.info(f"コメントアイテム数: {len(comment_items)}")
+    
+    for item in comment_items:
+        try:
+            res_id_match = re.search(r'res(\d+)', item.get('id', ''))
+            if not res_id_match:
+                continue
+            comment_id = res_id_match.group(1)
             
-            try:
-                res_id_match = re.search(r'res(\\d+)', item.get('id', ''))
-                if not res_id_match:
-                    continue
-                comment_id = res_id_match.group(1)
-                
-                resheader = item.select_one('.resheader')
-                if not resheader:
-                    continue
-                resnumber = resheader.select_one('.resnumber')
-                if not resnumber:
-                    continue
-                
-                comment_number = resnumber.text.strip()
-                author = resheader.select_one('.resname')
-                author_text = author.text.strip() if author else "不明"
-                date = resheader.select_one('.resposted')
-                date_text = date.text.strip() if date else "日時不明"
-                
-                resbody = item.select_one('div[class^="resbody"]')
-                if not resbody:
+            resheader = item.select_one('.resheader')
+            if not resheader:
+                continue
+            resnumber = resheader.select_one('.resnumber')
+            if not resnumber:
+                continue
+            
+            comment_number = resnumber.text.strip()
+            author = resheader.select_one('.resname')
+            author_text = author.text.strip() if author else "不明"
+            date = resheader.select_one('.resposted')
+            date_text = date.text.strip() if date else "日時不明"
+            
+            resbody = item.select_one('div[class^="resbody"]')
+            if not resbody:
+                continue
+            
+            anchors = []
+            reslinks = resbody.select('a.reslink')
+            for reslink in reslinks:
+                anchor_match = re.search(r'>>(\d+)', reslink.text)
+                if anchor_match:
+                    anchor_id = anchor_match.group(1)
+                    if anchor_id not in anchors:
+                        anchors.append(anchor_id)
+            
+            paragraphs = []
+            for p in resbody.find_all('p'):
+                if not p.parent or p.parent.name != 'blockquote':
+                    if not p.select('img') and not p.select('a.thumb'):
+                        paragraphs.append(p)
+            
+            comment_text = ""
+            for p in paragraphs:
+                p_text = p.get_text()
+                for anchor in anchors:
+                    p_text = p_text.replace(f">>{anchor}", "")
+                p_text = p_text.strip()
+                if p_text == "このレスは削除されています":
                     continue
-                
-                anchors = []
-                reslinks = resbody.select('a.reslink')
-                for reslink in reslinks:
-                    anchor_match = re.search(r'>>(\\d+)', reslink.text)
-                    if anchor_match:
-                        anchor_id = anchor_match.group(1)
-                        if anchor_id not in anchors:
-                            anchors.append(anchor_id)
-                
-                paragraphs = []
-                for p in resbody.find_all('p'):
-                    if not p.parent or p.parent.name != 'blockquote':
-                        if not p.select('img') and not p.select('a.thumb'):
-                            paragraphs.append(p)
-                
-                comment_text = ""
-                for p in paragraphs:
-                    p_text = p.get_text()
-                    for anchor in anchors:
-                        p_text = p_text.replace(f">>{anchor}", "")
-                    p_text = p_text.strip()
-                    if p_text == "このレスは削除されています":
-                        continue
-                    if p_text:
-                        if comment_text:
-                            comment_text += " " + p_text
-                        else:
-                            comment_text = p_text
-                
-                if resbody.select('a.thumb img'):
+                if p_text:
                     if comment_text:
-                        comment_text += " [画像あり]"
+                        comment_text += " " + p_text
                     else:
-                        comment_text = "[画像あり]"
-                
-                comments[comment_id] = {
-                    'id': comment_id,
-                    'number': comment_number,
-                    'author': author_text,
-                    'date': date_text,
-                    'text': comment_text,
-                    'anchors': anchors
-                }
-                
-            except Exception as e:
-                logging.error(f"コメントブロックの処理中にエラー発生: {e}")
-        
-        if websocket:
-            await websocket.send_text(json.dumps({"type": "progress", "message": "コメントの整理中..."}))
-        
-        logging.info(f"合計 {len(comments)} 件のコメントを抽出しました")
-        
-        return {
-            'title': page_title,
-            'comments': comments,
-            'url': url
-        }
-    except Exception as e:
-        if websocket:
-            await websocket.send_text(json.dumps({"type": "error", "message": f"エラーが発生しました: {str(e)}"}))
-        logging.error(f"スクレイピング中にエラー発生: {e}", exc_info=True)
-        raise
+                        comment_text = p_text
+            
+            if resbody.select('a.thumb img'):
+                if comment_text:
+                    comment_text += " [画像あり]"
+                else:
+                    comment_text = "[画像あり]"
+            
+            comments[comment_id] = {
+                'id': comment_id,
+                'number': comment_number,
+                'author': author_text,
+                'date': date_text,
+                'text': comment_text,
+                'anchors': anchors
+            }
+            
+        except Exception as e:
+            logging.error(f"コメントブロックの処理中にエラー発生: {e}")
+    
+    logging.info(f"合計 {len(comments)} 件のコメントを抽出しました")
+    
+    return {
+        'title': page_title,
+        'comments': comments,
+        'url': url
+    }
 
 def reorganize_comments(comments):
     """アンカー参照に基づいてコメントを再構成する"""
     try:
         organized_comments = []
         processed_ids = set()
-        comment_ids = sorted([int(cid) for cid in comments.keys()])
         
-        for current_id in comment_ids:
-            current_id_str = str(current_id)
-            if current_id_str in processed_ids:
+        for current_id in sorted(comments, key=int):
+            if current_id in processed_ids:
                 continue
-            organized_comments.append(comments[current_id_str])
-            processed_ids.add(current_id_str)
-            process_anchors_dfs(current_id_str, comments, organized_comments, processed_ids)
+            organized_comments.append(comments[current_id])
+            processed_ids.add(current_id)
+            process_anchors_dfs(current_id, comments, organized_comments, processed_ids)
         return organized_comments
     except Exception as e:
         logging.error(f"コメント再構成中にエラー発生: {e}", exc_info=True)
         raise
 
 def process_anchors_dfs(comment_id, comments, organized_comments, processed_ids):
-    """アンカー参照を深さ優先で処理する"""
-    if comment_id not in comments:
-        return
-    anchors = comments[comment_id]['anchors']
-    for anchor_id in anchors:
-        if anchor_id in processed_ids or anchor_id not in comments:
-            continue
-        organized_comments.append(comments[anchor_id])
-        processed_ids.add(anchor_id)
-        process_anchors_dfs(anchor_id, comments, organized_comments, processed_ids)
+    """アンカー参照を深さ優先で処理する（再帰せず、アンカー先リストのイテレータを積んだスタックでたどる）"""
+    stack = [iter(comments[comment_id]['anchors'])]
+    while stack:
+        for anchor_id in stack[-1]:
+            if anchor_id not in processed_ids and anchor_id in comments:
+                organized_comments.append(comments[anchor_id])
+                processed_ids.add(anchor_id)
+                stack.append(iter(comments[anchor_id]['anchors']))
+                break
+        else:
+            stack.pop()
 
 def format_comments_simple(comments):
     """コメントを簡易形式で出力する（本文のみを引用符で囲む）"""
@@ -406,6 +605,18 @@ def format_comments_simple(comments):
         logging.error(f"コメント整形（簡易版）中にエラー発生: {e}", exc_info=True)
         raise
 
+_NEWLINE_PATTERN = re.compile(r'\s*\n\s*')
+
+def iter_comment_texts(comments):
+    """コメントを順に受け取り、話者付き整形に渡す本文を返す（本文中の改行は空白にまとめる）"""
+    for comment in comments:
+        if comment['text']:
+            text = comment['text'].replace('[画像あり]', '').strip()
+            if text:
+                if '\n' in text:
+                    text = _NEWLINE_PATTERN.sub(' ', text)
+                yield text.strip('"')
+
 def format_with_speaker(comments, length=22, max_total_chars=20000, do_split=True):
     """コメントを話者付きで整形する"""
     try:
@@ -438,6 +649,10 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_http_client()
+
 # 静的ファイルとテンプレート（後で作成）
 # app.mount("/static", StaticFiles(directory="static"), name="static")
 # templates = Jinja2Templates(directory="templates")
@@ -825,52 +1040,55 @@ async def read_root(request: Request):
                 setTimeout(() => errorDiv.remove(), 5000);
             }
             
-            // スクレイピングフォーム
-            document.getElementById('scrape-form').addEventListener('submit', async (e) => {
+            // スクレイピングフォーム（WebSocketで進捗と整形済みの行を受け取り、届いた順に表示する）
+            document.getElementById('scrape-form').addEventListener('submit', (e) => {
                 e.preventDefault();
                 const url = document.getElementById('url').value;
+                const resultText = document.getElementById('scrape-result-text');
+                let lineCount = 0;
                 
+                if (ws) {
+                    ws.close();
+                }
                 showProgress('scrape');
+                document.getElementById('scrape-progress-fill').style.width = '0%';
+                resultText.textContent = '';
                 
-                try {
-                    // WebSocket接続
-                    ws = new WebSocket(`ws://localhost:8000/ws`);
-                    
-                    ws.onmessage = function(event) {
-                        const data = JSON.parse(event.data);
-                        if (data.type === 'progress') {
-                            document.getElementById('scrape-progress-text').textContent = data.message;
-                        } else if (data.type === 'error') {
-                            hideProgress('scrape');
-                            showError(data.message);
+                const protocol = location.protocol === 'https:' ? 'wss' : 'ws';
+                ws = new WebSocket(`${protocol}://${location.host}/ws`);
+                
+                ws.onopen = function() {
+                    ws.send(JSON.stringify({type: 'scrape', url: url}));
+                };
+                
+                ws.onmessage = function(event) {
+                    const data = JSON.parse(event.data);
+                    if (data.type === 'progress') {
+                        document.getElementById('scrape-progress-text').textContent = data.message;
+                        document.getElementById('scrape-progress-fill').style.width = `${data.percent}%`;
+                    } else if (data.type === 'line') {
+                        if (lineCount === 0) {
+                            document.getElementById('scrape-result').style.display = 'block';
                         }
-                    };
-                    
-                    const response = await fetch('/scrape', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/x-www-form-urlencoded',
-                        },
-                        body: `url=${encodeURIComponent(url)}`
-                    });
-                    
-                    const result = await response.text();
-                    
-                    if (response.ok) {
-                        showResult('scrape', result);
-                    } else {
+                        resultText.append((lineCount === 0 ? '' : '\\n') + data.text);
+                        lineCount += 1;
+                    } else if (data.type === 'done') {
                         hideProgress('scrape');
-                        showError(result);
+                        if (lineCount === 0) {
+                            showResult('scrape', 'テキストの整形に失敗しました。');
+                        }
+                        ws.close();
+                    } else if (data.type === 'error') {
+                        hideProgress('scrape');
+                        showError(data.message);
+                        ws.close();
                     }
-                    
-                } catch (error) {
-                    hideProgress('scrape');
-                    showError(error.message);
-                }
+                };
                 
-                if (ws) {
-                    ws.close();
-                }
+                ws.onerror = function() {
+                    hideProgress('scrape');
+                    showError('サーバーに接続できませんでした。');
+                };
             });
             
             // テキスト処理フォーム
@@ -959,7 +1177,7 @@ async def scrape_url(url: str = Form(...)):
         
         return formatted_text
         
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logging.error(f"ネットワークエラー: {e}")
         return f"ネットワークエラーが発生しました。しばらくしてから再試行してください。"
     except Exception as e:
@@ -1021,14 +1239,59 @@ async def health_check():
         "timestamp": datetime.now().isoformat()
     }
 
+async def run_scrape_job(websocket: WebSocket, url):
+    """WebSocketで受け付けたスクレイピングを実行し、段階ごとの進捗と整形済みの行を1行ずつ送る"""
+    url = (url or '').strip()
+    if not url.startswith('https://bbs.animanch.com/board/'):
+        await websocket.send_text(json.dumps({"type": "error", "message": "無効なURLです。あにまんchの掲示板URLを入力してください。"}))
+        return
+    
+    try:
+        scraped_data = await scrape_animanch(url, websocket)
+    except Exception:
+        # エラーはscrape_animanchが送信済み
+        return
+    if not scraped_data or not scraped_data.get('comments'):
+        await websocket.send_text(json.dumps({"type": "error", "message": "コメントが見つかりませんでした。"}))
+        return
+    
+    organized_comments = reorganize_comments(scraped_data['comments'])
+    await send_progress(websocket, "format", "テキストの整形中...")
+    
+    line_count = 0
+    for line in iter_speaker_lines(iter_comment_texts(organized_comments)):
+        await websocket.send_text(json.dumps({"type": "line", "text": line}))
+        line_count += 1
+    await websocket.send_text(json.dumps({
+        "type": "done",
+        "title": scraped_data['title'],
+        "lines": line_count
+    }))
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    """{"type": "scrape", "url": ...} を受け取るたびにスクレイピングして結果を流す"""
     await manager.connect(websocket)
     try:
         while True:
             data = await websocket.receive_text()
-            # WebSocketはプログレス通知用
-            await websocket.send_text(f"Echo: {data}")
+            try:
+                job = json.loads(data)
+            except ValueError:
+                job = None
+            if not isinstance(job, dict) or job.get('type') != 'scrape':
+                await websocket.send_text(json.dumps({
+                    "type": "error",
+                    "message": '不明なリクエストです。{"type": "scrape", "url": "..."} を送信してください。'
+                }))
+                continue
+            try:
+                await run_scrape_job(websocket, job.get('url'))
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                logging.error(f"WebSocketジョブでエラー: {e}", exc_info=True)
+                await websocket.send_text(json.dumps({"type": "error", "message": f"エラーが発生しました: {str(e)[:100]}"}))
     except WebSocketDisconnect:
         manager.disconnect(websocket)
     except Exception as e:
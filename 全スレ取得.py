@@ -1,7 +1,17 @@
 import os
 import re
+import time
+import json
+import hashlib
+import sqlite3
 import logging
-import requests
+import threading
+import random
+from email.utils import parsedate_to_datetime
+from collections import OrderedDict
+from bisect import bisect_right
+import httpx
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup, NavigableString
 from datetime import datetime
 import pyperclip
@@ -36,17 +46,204 @@ def detect_animanch_urls(text):
         logging.error(f"URL検出中にエラー発生: {e}")
         return []
 
+# GiNZAパイプライン（プロセス内で1回だけ読み込んで使い回す）
+_nlp = None
+_nlp_error = None
+_nlp_lock = threading.Lock()
+
+def get_nlp():
+    """読み込み済みのGiNZAパイプラインを返す（初回のみspacy.loadを実行）"""
+    global _nlp, _nlp_error
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                # 読み込みに失敗した場合はコメントごとに再試行しない
+                if _nlp_error is not None:
+                    raise _nlp_error
+                try:
+                    logging.info("GiNZAモデルを読み込みます")
+                    _nlp = spacy.load("ja_ginza")
+                except Exception as e:
+                    _nlp_error = e
+                    raise
+    return _nlp
+
+# nlp.pipeでまとめて解析するときの設定
+NLP_BATCH_SIZE = int(os.environ.get("NLP_BATCH_SIZE", "64"))
+NLP_N_PROCESS = int(os.environ.get("NLP_N_PROCESS", "1"))
+
+def parse_texts_batch(texts, batch_size=None, n_process=None):
+    """複数テキストを1回のnlp.pipeで解析し、{テキスト: Doc} を返す"""
+    unique_texts = list(dict.fromkeys(texts))
+    if not unique_texts:
+        return {}
+    nlp = get_nlp()
+    docs = nlp.pipe(
+        unique_texts,
+        batch_size=batch_size or NLP_BATCH_SIZE,
+        n_process=n_process or NLP_N_PROCESS
+    )
+    return dict(zip(unique_texts, docs))
+
+def warmup_nlp():
+    """起動時にモデルを読み込み、初回解析のコストも先に済ませておく"""
+    try:
+        get_nlp()("ウォームアップ用の文です。")
+        logging.info("GiNZAモデルの準備が完了しました")
+    except Exception as e:
+        logging.warning(f"GiNZAモデルを読み込めませんでした。ルールベース分割を使用します: {e}")
+
+# 分割結果のキャッシュ（本文のハッシュで引く。SEGMENT_CACHE_DBを指定するとSQLiteにも保存）
+SEGMENT_CACHE_SIZE = int(os.environ.get("SEGMENT_CACHE_SIZE", "10000"))
+SEGMENT_CACHE_DB = os.environ.get("SEGMENT_CACHE_DB", "")
+SEGMENT_CACHE_DB_SIZE = int(os.environ.get("SEGMENT_CACHE_DB_SIZE", "200000"))
+# GiNZAの意味スコア分割のバージョン（分割ロジックを変えたら上げる）
+SEMANTIC_SPLITTER_VERSION = "semantic-1"
+
+class SegmentCache:
+    """(本文ハッシュ, max_length, min_length, 分割器バージョン) → 分割ブロック のキャッシュ
+
+    メモリ上は件数上限付きLRU、SQLite側は最終利用時刻の古いものから削除する
+    """
+    
+    def __init__(self, max_entries=SEGMENT_CACHE_SIZE, db_path=SEGMENT_CACHE_DB, db_max_entries=SEGMENT_CACHE_DB_SIZE):
+        self.max_entries = max_entries
+        self.db_max_entries = db_max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS segments "
+                    "(key TEXT PRIMARY KEY, blocks TEXT NOT NULL, used_at REAL NOT NULL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS segments_used_at ON segments (used_at)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                logging.warning(f"分割キャッシュDBを開けないためメモリのみで動作します: {e}")
+                self._db = None
+    
+    @staticmethod
+    def make_key(text, max_length, min_length, version):
+        digest = hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+        return f"{version}:{max_length}:{min_length}:{digest}"
+    
+    def get(self, text, max_length, min_length, version):
+        key = self.make_key(text, max_length, min_length, version)
+        with self._lock:
+            blocks = self._entries.get(key)
+            if blocks is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(blocks)
+            if self._db is not None:
+                try:
+                    row = self._db.execute("SELECT blocks FROM segments WHERE key = ?", (key,)).fetchone()
+                    if row:
+                        self._db.execute("UPDATE segments SET used_at = ? WHERE key = ?", (time.time(), key))
+                        self._db.commit()
+                        blocks = tuple(json.loads(row[0]))
+                        self._remember(key, blocks)
+                        self.disk_hits += 1
+                        return list(blocks)
+                except sqlite3.Error as e:
+                    logging.warning(f"分割キャッシュDBの読み込みエラー: {e}")
+            self.misses += 1
+            return None
+    
+    def contains(self, text, max_length, min_length, version):
+        """統計やLRU順を変えずに有無だけを調べる"""
+        key = self.make_key(text, max_length, min_length, version)
+        with self._lock:
+            if key in self._entries:
+                return True
+            if self._db is None:
+                return False
+            try:
+                return self._db.execute("SELECT 1 FROM segments WHERE key = ?", (key,)).fetchone() is not None
+            except sqlite3.Error:
+                return False
+    
+    def put(self, text, max_length, min_length, version, blocks):
+        key = self.make_key(text, max_length, min_length, version)
+        blocks = tuple(blocks)
+        with self._lock:
+            self._remember(key, blocks)
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO segments (key, blocks, used_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(blocks, ensure_ascii=False), time.time())
+                )
+                self._db.commit()
+                self._db_writes += 1
+                if self._db_writes % 1000 == 0:
+                    self._trim_db()
+            except sqlite3.Error as e:
+                logging.warning(f"分割キャッシュDBの書き込みエラー: {e}")
+    
+    def _remember(self, key, blocks):
+        self._entries[key] = blocks
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def _trim_db(self):
+        count = self._db.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+        if count > self.db_max_entries:
+            self._db.execute(
+                "DELETE FROM segments WHERE key IN "
+                "(SELECT key FROM segments ORDER BY used_at LIMIT ?)",
+                (count - self.db_max_entries,)
+            )
+            self._db.commit()
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'disk': self._db is not None,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+segment_cache = SegmentCache()
+
 # 長いテキストを自然な区切りで分割する関数
-def split_long_text(text, max_length=80, min_length=30):
-    """意味を壊さず自然な分割を行い、短すぎる行を吸収するハイブリッド手法"""
+def split_long_text(text, max_length=80, min_length=30, doc=None):
+    """意味を壊さず自然な分割を行い、短すぎる行を吸収するハイブリッド手法
+
+    docにはnlp.pipeで解析済みのDocを渡せる（省略時はここで解析する）
+    """
+    cached = segment_cache.get(text, max_length, min_length, SEMANTIC_SPLITTER_VERSION)
+    if cached is not None:
+        return cached
     try:
         # Phase 1: 意味スコア分割
-        blocks = semantic_aware_split(text, max_length, min_length)
+        blocks = semantic_aware_split(text, max_length, min_length, doc=doc)
+        blocks = absorb_short_lines(blocks, min_length)
+        # 意味スコア分割の結果だけを保存する（フォールバック結果はモデル次第で変わるため）
+        segment_cache.put(text, max_length, min_length, SEMANTIC_SPLITTER_VERSION, blocks)
+        return blocks
     except Exception as e:
         logging.warning(f"semantic_aware_split失敗: {e}")
         try:
             # Phase 2: 文節ベース分割
-            blocks = bunsetsu_based_split(text, max_length)
+            blocks = bunsetsu_based_split(text, max_length, doc=doc)
         except Exception as e:
             logging.warning(f"bunsetsu_based_split失敗: {e}")
             # Phase 3: 改良ルールベース
@@ -54,9 +251,9 @@ def split_long_text(text, max_length=80, min_length=30):
     # ここで短すぎる行を吸収
     return absorb_short_lines(blocks, min_length)
 
-def semantic_aware_split(text, max_length=80, min_length=30):
-    nlp = spacy.load("ja_ginza")
-    doc = nlp(text)
+def semantic_aware_split(text, max_length=80, min_length=30, doc=None):
+    if doc is None:
+        doc = get_nlp()(text)
     scores = calculate_break_scores(doc)
     result = []
     start_pos = 0
@@ -101,9 +298,9 @@ def find_best_break_position(scores, start, end, min_length=30):
             return i+1
     return start
 
-def bunsetsu_based_split(text, max_length=80):
-    nlp = spacy.load("ja_ginza")
-    doc = nlp(text)
+def bunsetsu_based_split(text, max_length=80, doc=None):
+    if doc is None:
+        doc = get_nlp()(text)
     result = []
     current_block = ""
     for sent in doc.sents:
@@ -136,38 +333,52 @@ def build_bunsetsu_groups(sent):
         groups.append(current_group)
     return groups
 
+# 区切り候補と優先度（improved_rule_based_splitは先頭から見て最初に条件を満たしたものを採るため、スコアの高い順に並べること）
+RULE_BREAK_CHARS = [
+    ('。', 100), ('！', 100), ('？', 100),
+    ('、', 80), ('，', 80),
+    ('ので', 70), ('から', 70), ('けれど', 70),
+    ('という', 60), ('ところ', 60),
+    ('について', 50), ('に対して', 50),
+    ('は', 40), ('が', 40), ('を', 40), ('に', 40),
+    ('と', 30), ('で', 30), ('の', 30)
+]
+
+def find_break_positions(text, break_chars=RULE_BREAK_CHARS):
+    """区切り候補ごとの出現位置（昇順）をまとめて求める"""
+    positions = []
+    for bc, _ in break_chars:
+        found = []
+        pos = text.find(bc)
+        while pos != -1:
+            found.append(pos)
+            pos = text.find(bc, pos + 1)
+        positions.append(found)
+    return positions
+
 def improved_rule_based_split(text, max_length=80):
-    break_chars = [
-        ('。', 100), ('！', 100), ('？', 100),
-        ('、', 80), ('，', 80),
-        ('ので', 70), ('から', 70), ('けれど', 70),
-        ('という', 60), ('ところ', 60),
-        ('について', 50), ('に対して', 50),
-        ('は', 40), ('が', 40), ('を', 40), ('に', 40),
-        ('と', 30), ('で', 30), ('の', 30)
-    ]
+    """max_length文字の窓ごとに、窓の後半にある最も優先度の高い区切りで切る
+
+    区切り候補の位置を先に求めて二分探索で引くので、
+    1文字ずつ足してrfindし直していた旧実装と同じ結果を線形時間で返す
+    """
+    window = max(max_length, 1)
+    positions = find_break_positions(text)
     result = []
-    current_text = ""
-    i = 0
-    while i < len(text):
-        current_text += text[i]
-        if len(current_text) >= max_length:
-            best_pos = -1
-            best_score = 0
-            for bc, score in break_chars:
-                pos = current_text.rfind(bc)
-                if pos > len(current_text)//2 and score > best_score:
-                    best_pos = pos + len(bc)
-                    best_score = score
-            if best_pos > 0:
-                result.append(current_text[:best_pos])
-                current_text = current_text[best_pos:]
-            else:
-                result.append(current_text)
-                current_text = ""
-        i += 1
-    if current_text:
-        result.append(current_text)
+    start = 0
+    while len(text) - start >= window:
+        end = start + window
+        cut = end
+        for (bc, _), found in zip(RULE_BREAK_CHARS, positions):
+            # 窓に収まる最後の出現位置（旧実装のrfindに相当）
+            idx = bisect_right(found, end - len(bc)) - 1
+            if idx >= 0 and found[idx] - start > window // 2:
+                cut = found[idx] + len(bc)
+                break
+        result.append(text[start:cut])
+        start = cut
+    if start < len(text):
+        result.append(text[start:])
     return result
 
 def absorb_short_lines(blocks, min_length=30):
@@ -237,8 +448,16 @@ def split_long_text_fallback(text, max_length=80):
         result.append(current_text)
     return result
 
-def add_line_breaks(text, length=22, max_total_chars=20000, do_split=True, character_set=None):
-    """改行の追加とキャラクター名の挿入、文字数制限付き"""
+def wrap_line(text, length=22):
+    """textをlength文字ごとに区切った行のリストを返す"""
+    step = max(length, 1)
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
+def add_line_breaks(text, length=22, max_total_chars=20000, do_split=True, character_set=None, docs=None):
+    """改行の追加とキャラクター名の挿入、文字数制限付き
+
+    docsには {コメント本文: 解析済みDoc} を渡せる（collect_split_targetsで集めたもの）
+    """
     try:
         result_lines = []
         # キャラクターセットの定義
@@ -264,22 +483,14 @@ def add_line_breaks(text, length=22, max_total_chars=20000, do_split=True, chara
             
             # 分割オプションに基づいて処理
             if do_split and len(comment) > 80:
-                split_comments = split_long_text(comment)
+                split_comments = split_long_text(comment, doc=docs.get(comment) if docs else None)
             else:
                 split_comments = [comment]
             
             # 各分割部分を別々のブロックとして処理（同じキャラクターを使用）
             for split_comment in split_comments:
                 # 各分割部分を行に分ける（length文字ごと）
-                comment_lines = []
-                current_line = ''
-                for char in split_comment:
-                    current_line += char
-                    if len(current_line) >= length:
-                        comment_lines.append(current_line)
-                        current_line = ''
-                if current_line:
-                    comment_lines.append(current_line)
+                comment_lines = wrap_line(split_comment, length)
                 
                 if comment_lines:
                     # 各分割部分をそれぞれ独立したコメントとして出力（同じキャラクター）
@@ -299,16 +510,160 @@ def add_line_breaks(text, length=22, max_total_chars=20000, do_split=True, chara
         logging.error(f"改行追加処理でエラー発生: {e}")
         raise
 
+# 共有HTTPセッション（Webアプリと同じ接続プール設定を環境変数から読む）
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
+}
+FETCH_TIMEOUT = 15
+HTTP_POOL_SIZE = int(os.environ.get("ANIMANCH_POOL_SIZE", "20"))
+HTTP_MAX_PER_HOST = int(os.environ.get("ANIMANCH_MAX_PER_HOST", "6"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("ANIMANCH_KEEPALIVE_EXPIRY", "30"))
+# ホストごとのレート制限と再試行（api/index.pyと同じ環境変数）
+HOST_RATE = float(os.environ.get("ANIMANCH_RATE", "5"))
+HOST_BURST = float(os.environ.get("ANIMANCH_BURST", "5"))
+FETCH_RETRIES = int(os.environ.get("ANIMANCH_RETRIES", "3"))
+FETCH_BACKOFF_BASE = float(os.environ.get("ANIMANCH_BACKOFF_BASE", "0.5"))
+FETCH_BACKOFF_MAX = float(os.environ.get("ANIMANCH_BACKOFF_MAX", "30"))
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# h2がインストールされていればHTTP/2を使う
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_http_session = None
+_http_session_lock = threading.Lock()
+_host_semaphores = {}
+_host_limiters = {}
+
+def get_http_session():
+    """プロセス共有のHTTPセッションを返す（keep-aliveで接続を再利用）"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None or _http_session.is_closed:
+            _http_session = httpx.Client(
+                headers=DEFAULT_HEADERS,
+                timeout=FETCH_TIMEOUT,
+                follow_redirects=True,
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_SIZE,
+                    max_keepalive_connections=HTTP_POOL_SIZE,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+                )
+            )
+        return _http_session
+
+def get_host_semaphore(host):
+    """ホスト単位の同時接続数を制限するセマフォを返す"""
+    with _http_session_lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(HTTP_MAX_PER_HOST)
+            _host_semaphores[host] = semaphore
+        return semaphore
+
+class HostRateLimiter:
+    """1ホスト分のトークンバケット（送信予定時刻を予約する方式）と、Retry-Afterによる停止
+
+    一括取得のワーカースレッド間で共有するのでロックで守る
+    """
+    
+    def __init__(self, rate=HOST_RATE, burst=HOST_BURST):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.blocked_until = 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+    
+    def reserve(self, max_wait=None):
+        """次の1リクエストの枠を予約し、送信まで待つ秒数を返す（停止がmax_waitより長ければhttpx.HTTPError）"""
+        with self._lock:
+            now = time.monotonic()
+            if max_wait is not None and self.blocked_until - now > max_wait:
+                raise httpx.HTTPError(f"Retry-Afterにより {self.blocked_until - now:.0f}秒間リクエストを停止中です")
+            if self.rate <= 0:
+                return max(self.blocked_until - now, 0.0)
+            interval = 1 / self.rate
+            start = max(now, self.blocked_until, self._next - (self.burst - 1) * interval)
+            self._next = max(start, self._next) + interval
+            return start - now
+    
+    def throttle(self, retry_after=None):
+        """429/5xxを受けたときに呼ぶ（Retry-Afterがあればその間は予約を止める）"""
+        with self._lock:
+            now = time.monotonic()
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            if self.rate > 0:
+                # 制限が明けた直後にまとめて送らないよう、バースト分の余裕をなくして一定間隔で再開する
+                self._next = max(self._next, max(now, self.blocked_until) + (self.burst - 1) / self.rate)
+
+def get_host_limiter(host):
+    """ホストごとのレート制限を返す（初回呼び出し時に生成）"""
+    with _http_session_lock:
+        limiter = _host_limiters.get(host)
+        if limiter is None:
+            limiter = HostRateLimiter()
+            _host_limiters[host] = limiter
+        return limiter
+
+def parse_retry_after(value):
+    """Retry-Afterヘッダー（秒数またはHTTP日付）を秒数にする（解釈できなければNone）"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(retry_at.tzinfo)).total_seconds(), 0.0)
+
+def backoff_delay(attempt):
+    """再試行までの待ち時間（指数バックオフにフルジッターをかける）"""
+    return random.uniform(0, min(FETCH_BACKOFF_MAX, FETCH_BACKOFF_BASE * (2 ** attempt)))
+
+def fetch_page(url):
+    """レート制限を守ってページを取得する（429/5xxと通信エラーはRetry-Afterまたはジッター付きの待ち時間で再試行）"""
+    session = get_http_session()
+    host = httpx.URL(url).host
+    limiter = get_host_limiter(host)
+    for attempt in range(FETCH_RETRIES + 1):
+        time.sleep(limiter.reserve(FETCH_BACKOFF_MAX))
+        try:
+            with get_host_semaphore(host):
+                response = session.get(url)
+        except httpx.TransportError as e:
+            if attempt == FETCH_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            logging.warning(f"通信エラーのため{delay:.1f}秒後に再試行します ({attempt + 1}/{FETCH_RETRIES}): {url}: {e}")
+        else:
+            if response.status_code not in RETRYABLE_STATUS:
+                response.raise_for_status()  # エラーチェック
+                return response
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            limiter.throttle(retry_after)
+            # 待ち時間が長すぎるRetry-Afterは待たずに失敗させる
+            if attempt == FETCH_RETRIES or (retry_after is not None and retry_after > FETCH_BACKOFF_MAX):
+                response.raise_for_status()
+            if retry_after is not None:
+                # 次のreserveがRetry-Afterの時刻まで待つ
+                logging.warning(f"HTTP {response.status_code} のため{retry_after:.1f}秒後に再試行します ({attempt + 1}/{FETCH_RETRIES}): {url}")
+                continue
+            delay = backoff_delay(attempt)
+            logging.warning(f"HTTP {response.status_code} のため{delay:.1f}秒後に再試行します ({attempt + 1}/{FETCH_RETRIES}): {url}")
+        time.sleep(delay)
+
 def scrape_animanch(url):
     """あにまんchの掲示板ページからコメントを抽出する"""
     try:
         logging.info(f"ページの取得を開始: {url}")
-        # ユーザーエージェントを設定してリクエスト
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
-        }
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()  # エラーチェック
+        response = fetch_page(url)
         logging.info(f"ページの取得に成功。ステータスコード: {response.status_code}")
         # HTMLの解析
         soup = BeautifulSoup(response.text, 'html.parser')
@@ -448,48 +803,75 @@ def scrape_animanch(url):
         logging.error(f"スクレイピング中にエラー発生: {e}", exc_info=True)
         raise
 
+# 一括取得の同時実行数
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", "4"))
+
+def scrape_many(urls, max_workers=None):
+    """複数URLを並列に取得・解析し、入力順に (url, 結果, エラー) のリストを返す"""
+    max_workers = max_workers or BATCH_MAX_CONCURRENCY
+    
+    def run(url):
+        try:
+            return url, scrape_animanch(url), None
+        except Exception as e:
+            return url, None, e
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(run, urls))
+
+def process_urls_batch(urls):
+    """複数URLをまとめて処理し、URLごとにファイル保存してクリップボードに全結果をコピーする"""
+    outputs = []
+    errors = []
+    for url, scraped_data, error in scrape_many(urls):
+        if error is not None:
+            errors.append((url, str(error)))
+            continue
+        if not scraped_data or not scraped_data['comments']:
+            errors.append((url, "コメントが抽出できませんでした"))
+            continue
+        # 整形（GiNZAでの分割）はメインスレッドで順に行う
+        organized_comments = reorganize_comments(scraped_data['comments'])
+        formatted_text = format_with_speaker(organized_comments, character_set='classic')
+        output_path = save_to_file(formatted_text, prefix="yukkuri")
+        print(f"{url} -> {output_path}")
+        outputs.append(formatted_text)
+    for url, message in errors:
+        print(f"取得に失敗しました: {url} ({message})")
+    if outputs:
+        pyperclip.copy('\n'.join(outputs))
+        print(f"{len(outputs)} 件のスレッドをゆっくりボイス形式でクリップボードにコピーしました。")
+    return outputs, errors
+
 def reorganize_comments(comments):
     """アンカー参照に基づいてコメントを再構成する"""
     try:
-        # 結果を格納するリスト
         organized_comments = []
-        # 処理済みコメントを追跡するセット
         processed_ids = set()
-        # コメント番号のソート
-        comment_ids = sorted([int(cid) for cid in comments.keys()])
-        # 各コメントを順番に処理
-        for current_id in comment_ids:
-            current_id_str = str(current_id)
-            # すでに処理済みの場合はスキップ
-            if current_id_str in processed_ids:
+        
+        for current_id in sorted(comments, key=int):
+            if current_id in processed_ids:
                 continue
-            # 現在のコメントを追加
-            organized_comments.append(comments[current_id_str])
-            processed_ids.add(current_id_str)
-            # このコメントが参照するアンカーを処理 (深さ優先探索)
-            # 参照されたコメントとその参照コメントを再帰的に追加
-            process_anchors_dfs(current_id_str, comments, organized_comments, processed_ids)
+            organized_comments.append(comments[current_id])
+            processed_ids.add(current_id)
+            process_anchors_dfs(current_id, comments, organized_comments, processed_ids)
         return organized_comments
     except Exception as e:
         logging.error(f"コメント再構成中にエラー発生: {e}", exc_info=True)
         raise
 
 def process_anchors_dfs(comment_id, comments, organized_comments, processed_ids):
-    """アンカー参照を深さ優先で処理する"""
-    if comment_id not in comments:
-        return
-    # このコメントのアンカーを取得
-    anchors = comments[comment_id]['anchors']
-    # 各アンカーを処理
-    for anchor_id in anchors:
-        # アンカー先がすでに処理済みか、存在しない場合はスキップ
-        if anchor_id in processed_ids or anchor_id not in comments:
-            continue
-        # アンカー先のコメントを追加
-        organized_comments.append(comments[anchor_id])
-        processed_ids.add(anchor_id)
-        # そのアンカー先のアンカーも再帰的に処理
-        process_anchors_dfs(anchor_id, comments, organized_comments, processed_ids)
+    """アンカー参照を深さ優先で処理する（再帰せず、アンカー先リストのイテレータを積んだスタックでたどる）"""
+    stack = [iter(comments[comment_id]['anchors'])]
+    while stack:
+        for anchor_id in stack[-1]:
+            if anchor_id not in processed_ids and anchor_id in comments:
+                organized_comments.append(comments[anchor_id])
+                processed_ids.add(anchor_id)
+                stack.append(iter(comments[anchor_id]['anchors']))
+                break
+        else:
+            stack.pop()
 
 def format_comments(comments):
     """コメントを整形して出力する（詳細版）"""
@@ -504,16 +886,7 @@ def format_comments(comments):
                 formatted_text.append(anchors_text)
             # 本文を追加（22文字ごとに改行）
             if comment['text']:
-                text_lines = []
-                current_line = ""
-                for char in comment['text']:
-                    current_line += char
-                    if len(current_line) >= 22:
-                        text_lines.append(current_line)
-                        current_line = ""
-                if current_line:
-                    text_lines.append(current_line)
-                formatted_text.append("\n".join(text_lines))
+                formatted_text.append("\n".join(wrap_line(comment['text'], 22)))
             else:
                 formatted_text.append("[本文なし]")
             formatted_text.append("-" * 40)
@@ -539,18 +912,42 @@ def format_comments_simple(comments):
         logging.error(f"コメント整形（簡易版）中にエラー発生: {e}", exc_info=True)
         raise
 
-def format_with_speaker(comments, character_set=None, length=22, max_total_chars=20000, do_split=True):
+def collect_split_targets(text, max_total_chars=20000):
+    """add_line_breaksで分割対象になるコメント本文を、文字数上限に届くまで集める"""
+    targets = []
+    total_chars = 0
+    for comment in text.split('\n'):
+        if not comment.strip():
+            continue
+        if total_chars > max_total_chars:
+            break
+        comment = comment.strip().strip('"')
+        total_chars += len(comment)
+        # 分割済みキャッシュにあるコメントは解析しない
+        if len(comment) > 80 and not segment_cache.contains(comment, 80, 30, SEMANTIC_SPLITTER_VERSION):
+            targets.append(comment)
+    return targets
+
+def format_with_speaker(comments, character_set=None, length=22, max_total_chars=20000, do_split=True, n_process=None):
     """コメントを話者付きで整形する"""
     try:
         # まず簡易形式で出力
         simple_text = format_comments_simple(comments)
+        # 分割が必要なコメントを1回のnlp.pipeでまとめて解析しておく
+        docs = None
+        if do_split:
+            try:
+                docs = parse_texts_batch(collect_split_targets(simple_text, max_total_chars), n_process=n_process)
+            except Exception as e:
+                logging.warning(f"一括解析に失敗したためコメントごとに分割します: {e}")
         # 次に話者と改行を追加
         formatted_text = add_line_breaks(
             simple_text,
             length=length,
             max_total_chars=max_total_chars,
             do_split=do_split,
-            character_set=character_set
+            character_set=character_set,
+            docs=docs
         )
         return formatted_text
     except Exception as e:
@@ -638,6 +1035,8 @@ def save_to_file(text, prefix="animanch"):
 
 def main():
     try:
+        # GiNZAモデルは起動時に1回だけ読み込む
+        warmup_nlp()
         # クリップボードのテキストを取得
         clipboard_text = pyperclip.paste()
         print("クリップボードのテキストを取得しました。")
@@ -672,7 +1071,11 @@ def main():
                 print("スクレイピングするURLを選択してください:")
                 for i, url in enumerate(urls):
                     print(f"{i}: {url}")
-                url_choice = input(f"選択 (0-{len(urls)-1}, デフォルト=0): ").strip()
+                url_choice = input(f"選択 (0-{len(urls)-1}, a=すべて, デフォルト=0): ").strip()
+                if url_choice.lower() == 'a':
+                    # すべてのURLを一括処理
+                    process_urls_batch(urls)
+                    return
                 if not url_choice or not url_choice.isdigit() or int(url_choice) >= len(urls):
                     url_choice = "0"
                 selected_url = urls[int(url_choice)]